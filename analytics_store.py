@@ -0,0 +1,354 @@
+# analytics_store.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from data_loader import AGE_COL, GENDER_COL, NATIONALITY_COL
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+# Every processed upload and batch run is kept here, so comments from past runs
+# can be analysed together without uploading them again. The store is a DuckDB
+# file when duckdb is installed and a SQLite file otherwise; the extension of
+# PILGRIM_ANALYTICS_DB picks the backend (.duckdb for DuckDB, anything else SQLite).
+ANALYTICS_DB = os.environ.get(
+    "PILGRIM_ANALYTICS_DB",
+    os.path.join(".cache", "analytics.duckdb" if _duckdb() is not None else "analytics.sqlite"),
+)
+LOCK_TIMEOUT = 60  # seconds to wait for another process writing to the store
+LANGUAGE_SAMPLE = 40  # letters looked at to tell a comment's writing system
+
+# Processed column -> column of the comments table
+COMMENT_COLUMNS = {
+    "Original": "comment",
+    "Translated": "translation",
+    "Department": "department",
+    "Primary Sentiment": "sentiment",
+    "Confidence": "confidence",
+    NATIONALITY_COL: "nationality",
+    GENDER_COL: "gender",
+    AGE_COL: "age",
+}
+# Columns of the comment_counts rollup. Breakdowns by these read the rollup,
+# whose size grows with the number of distinct combinations, not of comments.
+DIMENSIONS = ["department", "sentiment", "nationality", "gender", "language"]
+BREAKDOWN = ["department", "sentiment", "nationality"]
+
+_TABLES = {
+    "comments": [
+        ("run_id", "text"), ("source_file", "text"), ("processed_at", "text"), ("comment", "text"),
+        ("translation", "text"), ("language", "text"), ("department", "text"), ("sentiment", "text"),
+        ("confidence", "real"), ("nationality", "text"), ("gender", "text"), ("age", "integer"),
+    ],
+    "comment_counts": [
+        ("run_id", "text"), ("day", "text"), *((name, "text") for name in DIMENSIONS),
+        ("comments", "integer"), ("confidence_sum", "real"),
+    ],
+    "runs": [("run_id", "text"), ("source_file", "text"), ("comments", "integer"), ("finished_at", "text")],
+}
+_TYPES = {
+    "sqlite": {"text": "TEXT", "real": "REAL", "integer": "INTEGER"},
+    "duckdb": {"text": "VARCHAR", "real": "DOUBLE", "integer": "BIGINT"},
+}
+# SQLite only: DuckDB answers these filters from the min/max statistics it keeps per column block
+_INDEXES = [
+    ("comments", ["department", "sentiment", "nationality"]),
+    ("comments", ["run_id"]),
+    ("comment_counts", ["department", "sentiment", "nationality"]),
+]
+
+
+def comment_language(text):
+    """The writing system of most of the first letters of `text`, e.g. "arabic" or "latin".
+
+    Arabic, Urdu and Persian share a script, as do most European languages, so
+    this tells comments apart by script rather than by language; it needs no
+    detection service and costs nothing next to translation.
+    """
+    if not isinstance(text, str):
+        return None
+    counts = {}
+    letters = 0
+    for char in text:
+        if char.isalpha():
+            script = unicodedata.name(char, "").split(" ", 1)[0].lower()
+            counts[script] = counts.get(script, 0) + 1
+            letters += 1
+            if letters >= LANGUAGE_SAMPLE:
+                break
+    return max(counts, key=counts.get) if counts else None
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@contextmanager
+def _transaction(db):
+    """Commit everything the block writes on `db`, or none of it."""
+    db.execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+
+
+class AnalyticsStore:
+    """Processed comments of every run, with their demographics, in one embedded database.
+
+    Write a run with `recorder`; query with `breakdown`, `comments` and `runs`.
+    Queries open a connection per call, a recorder holds one for its run, and
+    writers wait for each other, so the app's jobs and a batch run can share
+    the file.
+    """
+
+    def __init__(self, path=ANALYTICS_DB):
+        self.path = path
+        self.backend = "duckdb" if path.endswith(".duckdb") else "sqlite"
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.backend == "sqlite":
+            db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+            db.execute("PRAGMA journal_mode = WAL")
+            return db
+        duckdb = _duckdb()
+        if duckdb is None:
+            raise RuntimeError(f"{self.path} is a DuckDB store; install duckdb or use a .sqlite path")
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                return duckdb.connect(self.path)
+            except duckdb.IOException:
+                # Another process has the file open; it lets go after its current write
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _db(self):
+        db = self._connect()
+        if not self._ready:
+            with self._lock:
+                types = _TYPES[self.backend]
+                for table, columns in _TABLES.items():
+                    db.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                               f"({', '.join(f'{name} {types[kind]}' for name, kind in columns)})")
+                for table, columns in _INDEXES if self.backend == "sqlite" else []:
+                    db.execute(f"CREATE INDEX IF NOT EXISTS {table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+                db.commit()
+                self._ready = True
+        return db
+
+    def _insert(self, db, table, frame):
+        for name in frame.columns[frame.dtypes == object]:
+            frame[name] = frame[name].where(frame[name].notna(), None)
+        if self.backend == "duckdb":
+            db.register("pending_rows", frame)
+            db.execute(f"INSERT INTO {table} SELECT * FROM pending_rows")
+            db.unregister("pending_rows")
+        else:
+            rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+            db.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(frame.columns))})", rows)
+
+    def _query(self, sql, params) -> pd.DataFrame:
+        with closing(self._db()) as db:
+            if self.backend == "duckdb":
+                return db.execute(sql, params).df()
+            return pd.read_sql_query(sql, db, params=params)
+
+    def forget(self, run_id, db=None):
+        """Delete everything recorded for `run_id`, on `db` if given or a connection of its own."""
+        if db is None:
+            with closing(self._db()) as db:
+                return self.forget(run_id, db)
+        with _transaction(db):
+            for table in _TABLES:
+                db.execute(f"DELETE FROM {table} WHERE run_id = ?", [run_id])
+
+    def recorder(self, key, source_file) -> "RunRecorder":
+        """A writer for the processed chunks of the run identified by `key`.
+
+        `key` must identify the input and the pipeline, like a run cache key:
+        recording the same run again replaces it rather than counting it twice.
+        """
+        run_id = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+        return RunRecorder(self, run_id, source_file)
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for name, values in filters.items():
+            if values is not None:
+                clauses.append(f"{name} IN ({', '.join('?' * len(values))})" if values else "1 = 0")
+                params.extend(values)
+        return clauses, params
+
+    def breakdown(self, by=BREAKDOWN, departments=None, sentiments=None, nationalities=None,
+                  start=None, end=None) -> pd.DataFrame:
+        """Comments and mean confidence per combination of the `by` columns, largest first.
+
+        Filters left as None do not restrict; `start` and `end` are inclusive
+        "YYYY-MM-DD" dates on which runs were processed. When `by` only uses
+        DIMENSIONS the answer comes from the rollup; other columns of the
+        comments table, such as age or source_file, are grouped row by row.
+        """
+        by = list(by)
+        unknown = [name for name in by if name not in dict(_TABLES["comments"])]
+        if unknown:
+            raise ValueError(f"Cannot break down by {', '.join(unknown)}")
+        rollup = all(name in DIMENSIONS for name in by)
+        if rollup:
+            table, day, count, confidence = "comment_counts", "day", "SUM(comments)", "SUM(confidence_sum)"
+        else:
+            table, day, count, confidence = ("comments", "substr(processed_at, 1, 10)", "COUNT(*)",
+                                             "SUM(confidence)")
+        clauses, params = self._where({"department": departments, "sentiment": sentiments, "nationality": nationalities})
+        if not rollup:
+            # Rows of a run still being written are left out, as they are from the rollup
+            clauses.append("run_id IN (SELECT run_id FROM runs)")
+        if start is not None:
+            clauses.append(f"{day} >= ?")
+            params.append(str(start))
+        if end is not None:
+            clauses.append(f"{day} <= ?")
+            params.append(str(end))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        columns = ", ".join(by)
+        group = f" GROUP BY {columns}" if by else ""
+        select = f"{columns}, " if by else ""
+        frame = self._query(
+            f"SELECT {select}CAST({count} AS BIGINT) AS comments, {confidence} / {count} AS mean_confidence"
+            f" FROM {table}{where}{group} ORDER BY comments DESC{', ' + columns if by else ''}",
+            params,
+        )
+        return frame[pd.to_numeric(frame["comments"]) > 0].reset_index(drop=True)
+
+    def comments(self, departments=None, sentiments=None, nationalities=None, limit=100, offset=0) -> pd.DataFrame:
+        """Recorded comments matching the filters, most recently processed first."""
+        clauses, params = self._where({"department": departments, "sentiment": sentiments, "nationality": nationalities})
+        clauses.append("run_id IN (SELECT run_id FROM runs)")
+        columns = ", ".join(name for name, _ in _TABLES["comments"][1:])
+        return self._query(
+            f"SELECT {columns} FROM comments WHERE {' AND '.join(clauses)}"
+            f" ORDER BY processed_at DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        )
+
+    def runs(self) -> pd.DataFrame:
+        """Every recorded run, most recent first."""
+        return self._query("SELECT * FROM runs ORDER BY finished_at DESC", [])
+
+
+class RunRecorder:
+    """Appends one run's processed chunks to an AnalyticsStore.
+
+    Use as a context manager. Rows are written chunk by chunk; the run only
+    shows up in queries once it is complete, and a run that fails is removed.
+    On SQLite one connection serves the whole run. An open DuckDB connection
+    locks the file against every other process, so there each write and
+    `close` connect for their own transaction and let go straight after.
+    """
+
+    def __init__(self, store, run_id, source_file):
+        self.store = store
+        self.run_id = run_id
+        self.source_file = source_file
+        self.rows = 0
+        self._counts = []
+        self._db = None
+
+    def __enter__(self):
+        if self.store.backend == "sqlite":
+            self._db = self.store._db()
+        try:
+            # A run recorded before, completely or not, is replaced
+            with self._connection() as db:
+                self.store.forget(self.run_id, db)
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.close()
+            else:
+                with self._connection() as db:
+                    self.store.forget(self.run_id, db)
+        finally:
+            self._release()
+        return False
+
+    @contextmanager
+    def _connection(self):
+        if self._db is not None:
+            yield self._db
+        else:
+            with closing(self.store._db()) as db:
+                yield db
+
+    def _release(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def write(self, chunk: pd.DataFrame, source_file=None):
+        """Record a processed chunk; `source_file` overrides the run's for this chunk."""
+        table = chunk.reindex(columns=list(COMMENT_COLUMNS)).rename(columns=COMMENT_COLUMNS)
+        table["age"] = pd.to_numeric(table["age"], errors="coerce").round().astype("Int64")
+        table["confidence"] = pd.to_numeric(table["confidence"], errors="coerce")
+        for name in ("comment", "translation", "department", "sentiment", "nationality", "gender"):
+            table[name] = table[name].astype(object)
+        table["language"] = table["comment"].map(comment_language)
+        table["run_id"] = self.run_id
+        table["source_file"] = source_file or self.source_file
+        table["processed_at"] = _now()
+        table = table[[name for name, _ in _TABLES["comments"]]]
+        with self._connection() as db, _transaction(db):
+            self.store._insert(db, "comments", table)
+        self.rows += len(table)
+
+        table["day"] = table["processed_at"].str[:10]
+        keys = ["day", *DIMENSIONS]
+        # Missing values are kept as their own groups so totals match the rows
+        self._counts.append(table.groupby(keys, dropna=False).agg(
+            comments=("run_id", "size"), confidence_sum=("confidence", "sum")
+        ).reset_index())
+        if len(self._counts) > 1:
+            self._counts = [pd.concat(self._counts).groupby(keys, dropna=False).sum().reset_index()]
+
+    def close(self):
+        """Add the run's rollup and mark it complete; a run without rows is not recorded."""
+        if not self.rows:
+            return
+        counts = self._counts[0]
+        counts.insert(0, "run_id", self.run_id)
+        counts = counts.reindex(columns=[name for name, _ in _TABLES["comment_counts"]])
+        run = pd.DataFrame([(self.run_id, self.source_file, self.rows, _now())],
+                           columns=[name for name, _ in _TABLES["runs"]])
+        with self._connection() as db, _transaction(db):
+            self.store._insert(db, "comment_counts", counts)
+            self.store._insert(db, "runs", run)
+
+
+# Module state survives Streamlit reruns, so one instance serves the whole process
+analytics_store = AnalyticsStore()
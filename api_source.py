@@ -0,0 +1,197 @@
+# api_source.py
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from data_loader import concat_dashboard_frames, prepare_dashboard_frame, read_dashboard_csv
+from ingest_cache import content_hash
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 60)
+MAX_PAGES = 1000
+MAX_FEEDS = 16  # feeds kept with their pages; the least recently used are dropped
+# Keys checked, in order, for records and the continuation in JSON pages
+JSON_RECORD_KEYS = ("data", "results", "items", "records")
+JSON_NEXT_KEYS = ("next", "next_url", "next_page")
+JSON_CURSOR_KEYS = ("next_cursor", "cursor")
+CURSOR_PARAM = "cursor"
+
+
+def make_session(pool_size=10, retries=3) -> requests.Session:
+    """Build a session whose connections are pooled and reused across fetches."""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _with_cursor(url, cursor):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != CURSOR_PARAM]
+    query.append((CURSOR_PARAM, str(cursor)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class _HashingReader(io.RawIOBase):
+    """Binary stream over `raw` that hashes the bytes as they are read."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.hash = hashlib.blake2b(digest_size=16)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        self.hash.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _Page:
+    __slots__ = ("url", "etag", "last_modified", "frame", "next_url", "body_hash")
+
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.frame = None
+        self.next_url = None
+        self.body_hash = None
+
+
+class ApiFeed:
+    """Incrementally synchronised copy of a CSV or JSON API data source.
+
+    Each page is requested conditionally (If-None-Match / If-Modified-Since),
+    so an unchanged feed costs a single 304 on the last page. Servers that
+    send neither validator answer with the whole page; its body is hashed, and
+    a page whose bytes did not change does not count as new data. Pages are chained
+    through a ``Link: rel="next"`` header, or a ``next``/``next_cursor`` field in
+    JSON bodies; on refresh only the last known page and anything after it are
+    requested, so a growing feed transfers just the new pages. CSV bodies are
+    parsed straight from the socket instead of being buffered as text.
+    """
+
+    def __init__(self, url, session=None, timeout=DEFAULT_TIMEOUT, max_pages=MAX_PAGES):
+        self.url = url
+        self.session = session or _shared_session()
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.pages = []
+        self.version = 0
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def digest(self) -> str:
+        """Key for the current contents: the hashes of the page bodies, so it only
+        changes when a fetch brings different bytes."""
+        return content_hash("\n".join([self.url, *(page.body_hash or "" for page in self.pages)]))
+
+    def fetch(self) -> pd.DataFrame:
+        """Bring the feed up to date and return the combined dataset."""
+        with self._lock:
+            start = len(self.pages) - 1 if self.pages else 0
+            if not self.pages:
+                self.pages.append(_Page(self.url))
+            changed = False
+            index = start
+            while index < len(self.pages) and index < self.max_pages:
+                page = self.pages[index]
+                if self._refresh_page(page):
+                    changed = True
+                    # Everything after a changed page is re-walked from its new next link
+                    del self.pages[index + 1:]
+                    if page.next_url and page.next_url != page.url:
+                        self.pages.append(_Page(page.next_url))
+                index += 1
+            if changed or self._frame is None:
+                frames = [p.frame for p in self.pages if p.frame is not None and not p.frame.empty]
+                self._frame = concat_dashboard_frames(frames) if frames else self.pages[0].frame
+                self.version += 1
+            return self._frame
+
+    def _refresh_page(self, page) -> bool:
+        """Request `page` again; True if its body or its next link changed."""
+        headers = {}
+        if page.frame is not None:
+            if page.etag:
+                headers["If-None-Match"] = page.etag
+            if page.last_modified:
+                headers["If-Modified-Since"] = page.last_modified
+        with self.session.get(page.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            page.etag = response.headers.get("ETag")
+            page.last_modified = response.headers.get("Last-Modified")
+            previous = (page.body_hash, page.next_url)
+            next_link = response.links.get("next", {}).get("url")
+            page.next_url = requests.compat.urljoin(page.url, next_link) if next_link else None
+            content_type = response.headers.get("Content-Type", "")
+            if "json" in content_type:
+                page.body_hash = content_hash(response.content)
+                frame = self._parse_json(page, response.json())
+            else:
+                response.raw.decode_content = True
+                reader = _HashingReader(response.raw)
+                frame = read_dashboard_csv(io.BufferedReader(reader))
+                page.body_hash = reader.hash.hexdigest()
+        if (page.body_hash, page.next_url) == previous:
+            return False
+        page.frame = frame
+        return True
+
+    def _parse_json(self, page, payload) -> pd.DataFrame:
+        records = payload
+        if isinstance(payload, dict):
+            records = next((payload[k] for k in JSON_RECORD_KEYS if k in payload), [])
+            next_url = next((payload[k] for k in JSON_NEXT_KEYS if payload.get(k)), None)
+            cursor = next((payload[k] for k in JSON_CURSOR_KEYS if payload.get(k)), None)
+            if next_url:
+                page.next_url = requests.compat.urljoin(page.url, next_url)
+            elif cursor is not None:
+                page.next_url = _with_cursor(page.url, cursor)
+        return prepare_dashboard_frame(pd.json_normalize(records))
+
+
+_session = None
+_feeds = OrderedDict()
+_registry_lock = threading.RLock()
+
+
+def _shared_session():
+    global _session
+    with _registry_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def api_feed(url) -> ApiFeed:
+    """Return the process-wide feed for `url`, so refresh ticks reuse its state.
+
+    The MAX_FEEDS most recently used feeds are kept; a dropped feed starts
+    again from the first page the next time its URL is asked for.
+    """
+    with _registry_lock:
+        if url in _feeds:
+            _feeds.move_to_end(url)
+        else:
+            _feeds[url] = ApiFeed(url)
+            while len(_feeds) > MAX_FEEDS:
+                _feeds.popitem(last=False)
+        return _feeds[url]
@@ -3,34 +3,36 @@ os.environ["STREAMLIT_DISABLE_WATCHDOG_WARNINGS"] = "true"
 os.environ["STREAMLIT_WATCHDOG_MODE"] = "none"
 
 import streamlit as st
-import base64
-import pandas as pd
-import plotly.express as px
-import seaborn as sns
-import matplotlib.pyplot as plt
-import requests
+from functools import partial
 from io import StringIO
 from streamlit_autorefresh import st_autorefresh
-from deep_translator import GoogleTranslator
-from transformers import pipeline
-import pdfplumber
+from data_loader import read_dashboard_archive, read_dashboard_csv, read_dashboard_excel
+from archives import ARCHIVE_TYPES
+from static_assets import asset_url
+from ingest_cache import ingest_cache, content_hash, upload_hash
+from api_source import api_feed
+from weighted_stats import weighted_summary
+from dashboard_charts import (age_distribution_png, age_line_figure, decimate, demographics_figure,
+                              figure_payload_bytes, mean_age_bubble_figure, nationality_gender_figure)
+from demographic_cube import (build_cube, build_filter_index, filter_cube, filter_key, DashboardViews,
+                              DATE_BUCKET_COL, TOP_NATIONALITIES)
+from comment_pipeline import load_pipeline
+from jobs import analyze_upload
+from result_writer import EXCEL_MIME, excel_bytes
+from results_viewer import current_job, job_status, results_viewer
+from run_cache import run_cache
 
 # --- CONFIGURING PAGES ---
 st.set_page_config(page_title="PILGRIMAGE DEMOGRAPHICS DASHBOARD", layout="wide")
 
-# --- SETTING UP BACKGROUND HELPER ---
-def get_base64(fp):
-    with open(fp, "rb") as f:
-        return base64.b64encode(f.read()).decode()
-
 # --- SETTING UP THE HOME PAGE ---
 def home():
-    img_b64 = get_base64("pilgrimage.png")
+    img_url = asset_url("pilgrimage.png")
 
     st.markdown(f"""
     <style>
       .stApp {{
-        background-image: url("data:image/png;base64,{img_b64}");
+        background-image: url("{img_url}");
         background-size: cover;
         background-position: center;
         background-repeat: no-repeat;
@@ -94,13 +96,13 @@ def dashboard():
     st.title("Cross-Demographic and Demographic Analysis Dashboard")
 
     # -- Load image
-    img_b64 = get_base64("analysis.png")
+    img_url = asset_url("analysis.png")
 
     # -- USE THE HTML AND CSS TO ADD IMAGES AND TEXT OVERLAY 
     st.markdown(f"""
     <style>
       .custom-container {{
-        background: url("data:image/png;base64,{img_b64}") no-repeat center;
+        background: url("{img_url}") no-repeat center;
         background-size: cover;
         padding: 2rem;
         border-radius: 1rem;
@@ -152,15 +154,19 @@ def dashboard():
     data_source = st.radio("Load Data Appropriately by Select the right Data Source ", ['Upload File', 'Enter API URL', 'Paste Raw Text'])
 
     dataset = None
+    dataset_key = None
     if data_source == 'Upload File':
-        uploaded_file = st.file_uploader("Upload your data file", type=['csv', 'xlsx', 'xls', 'ods', 'txt', 'pdf'])
+        uploaded_file = st.file_uploader("Upload your data file", type=['csv', 'xlsx', 'xls', 'ods', 'txt', 'pdf'] + ARCHIVE_TYPES)
         if uploaded_file is not None:
             file_type = uploaded_file.name.split('.')[-1].lower()
+            dataset_key = upload_hash(uploaded_file)
             try:
                 if file_type in ['csv', 'txt']:
-                    dataset = pd.read_csv(uploaded_file, encoding='utf-8', errors='replace')
+                    dataset = ingest_cache.get_or_load(dataset_key, lambda: read_dashboard_csv(uploaded_file))
                 elif file_type in ['xls', 'xlsx', 'ods']:
-                    dataset = pd.read_excel(uploaded_file)
+                    dataset = ingest_cache.get_or_load(dataset_key, lambda: read_dashboard_excel(uploaded_file))
+                elif file_type in ARCHIVE_TYPES:
+                    dataset = ingest_cache.get_or_load(dataset_key, lambda: read_dashboard_archive(uploaded_file))
                 elif file_type == 'pdf':
                     st.error("PDF files are currently not supported for data upload. Please upload CSV or Excel files.")
                 else:
@@ -172,16 +178,17 @@ def dashboard():
         api_url = st.text_input("Enter API URL returning data")
         if api_url:
             try:
-                response = requests.get(api_url)
-                response.raise_for_status()
-                dataset = pd.read_csv(StringIO(response.text))
+                feed = api_feed(api_url)
+                dataset = feed.fetch()
+                dataset_key = feed.digest
             except Exception as e:
                 st.error(f"Failed to fetch data from API: {e}")
     elif data_source == 'Paste Raw Text':
         raw_csv = st.text_area("Paste your text data here")
         if raw_csv:
             try:
-                dataset = pd.read_csv(StringIO(raw_csv))
+                dataset_key = content_hash(raw_csv)
+                dataset = ingest_cache.get_or_load(dataset_key, lambda: read_dashboard_csv(StringIO(raw_csv)))
             except Exception as e:
                 st.error(f"Failed to parse CSV text: {e}")
   
@@ -192,7 +199,7 @@ def dashboard():
         return
 
 
-    dataset.columns = dataset.columns.str.strip()
+    # Columns are stripped and typed by the loader; the cached frame is shared, so never mutate it
     required_cols = ['العمر Age', 'الجنسية Nationality', 'الجنس Gender']
     if not all(col in dataset.columns for col in required_cols):
         st.error("❌ Required columns not found in uploaded data.")
@@ -200,33 +207,49 @@ def dashboard():
             st.session_state.page = "home"
         return
 
-    # Translate genders
-    gender_map = {'أنثى': 'أنثى : Female', 'ذكر': 'ذكر: Male'}
-    dataset['Gender_English'] = dataset['الجنس Gender'].map(gender_map)
+    # Detect date column if exists
+    date_cols = [c for c in dataset.columns if 'date' in c.lower()]
+    date_column = date_cols[0] if date_cols else None
+
+    # Filters and charts are answered from the pre-aggregated cube, built once per dataset
+    cube = ingest_cache.derive(dataset_key, ("cube", date_column), lambda: build_cube(dataset, date_column))
+    cube_index = ingest_cache.derive(dataset_key, ("cube_index", date_column), lambda: build_filter_index(cube))
+
+    # Filters and charts form a fragment: changing a filter reruns only that part,
+    # not the data loading above
+    dashboard_view(dataset_key, cube, cube_index, date_column)
+
+    if st.button("Back to Home"):
+        st.session_state.page = "home"
+
 
+@st.fragment
+def dashboard_view(dataset_key, cube, cube_index, date_column):
+    """Filters and charts for one dataset, rerun on their own when a filter changes."""
     # --- ADDING FILTERS TO FILTER DATA ANALYSIS---
     st.markdown("### Filter Data")
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        gender_options = dataset['الجنس Gender'].dropna().unique()
+        gender_options = cube['الجنس Gender'].dropna().unique().tolist()
         selected_genders = st.multiselect("Filter by Gender: Female( ذكر) and (ذكر) Male", options=gender_options, default=list(gender_options))
 
     with col2:
-        nationality_options = dataset['الجنسية Nationality'].dropna().unique()
+        nationality_options = cube['الجنسية Nationality'].dropna().unique().tolist()
         selected_nationalities = st.multiselect("Filter by Nationality", options=nationality_options, default=list(nationality_options))
+        # Nationality charts show the top N and group the rest, so they stay readable with 180+ nationalities
+        top_n = st.number_input(
+            'Nationalities charted individually (the rest are grouped as "Other")',
+            min_value=1, max_value=max(len(nationality_options), 1),
+            value=min(TOP_NATIONALITIES, max(len(nationality_options), 1))
+        )
 
-    # Detect date column if exists
-    date_cols = [c for c in dataset.columns if 'date' in c.lower()]
-    date_column = None
     date_range = None
 
-    if date_cols:
-        date_column = date_cols[0]
-        dataset[date_column] = pd.to_datetime(dataset[date_column], errors='coerce')
-        min_date = dataset[date_column].min()
-        max_date = dataset[date_column].max()
+    if date_column:
+        min_date = cube[DATE_BUCKET_COL].min()
+        max_date = cube[DATE_BUCKET_COL].max()
 
         with col3:
             date_range = st.date_input(
@@ -239,110 +262,72 @@ def dashboard():
         with col3:
             st.write("No date column found for filtering")
 
-    # Apply filters
-    filtered_df = dataset[
-        dataset['الجنس Gender'].isin(selected_genders) &
-        dataset['الجنسية Nationality'].isin(selected_nationalities)
-    ]
-
-    if date_column and date_range and len(date_range) == 2:
-        start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-        filtered_df = filtered_df[
-            (filtered_df[date_column] >= start_date) &
-            (filtered_df[date_column] <= end_date)
-        ]
+    # Apply filters; the chart aggregates are cached per filter selection, so going back to one is free
+    selected_dates = date_range if date_column else None
+    filters = filter_key(selected_genders, selected_nationalities, selected_dates)
+    views = ingest_cache.derive_view(
+        dataset_key, ("views", date_column, filters, top_n),
+        lambda: DashboardViews(
+            filter_cube(cube, selected_genders, selected_nationalities, selected_dates, index=cube_index), top_n=top_n
+        )
+    )
 
     # --- Preview data ---
     st.markdown("### Data Visualization")
     #st.write(filtered_df.head())
 
-    # ---- 1. Age Distribution Stats (Matplotlib) ----
-    df_Age = filtered_df["العمر Age"].value_counts().reset_index()
-    df_Age.columns = ['العمر Age', 'count']
-    df_Age = df_Age.sort_values('العمر Age')
-    df_repeated = df_Age['العمر Age'].repeat(df_Age['count']).astype(float)
+    df_Age = views.age()
 
-    if df_repeated.empty:
+    if df_Age.empty:
         st.warning("No data after applying filters.")
         return
 
-    stats = {
-        "max": df_repeated.max(),
-        "min": df_repeated.min(),
-        "q1": df_repeated.quantile(0.25),
-        "median": df_repeated.median(),
-        "q3": df_repeated.quantile(0.75),
-        "std": df_repeated.std(),
-        "mean": df_repeated.mean(),
-        "mode": df_repeated.mode().iloc[0]
-    }
+    # Only the open tab runs: its aggregates and figure are built on first view, then
+    # kept with the other views for this filter selection
+    tab_stats, tab_age, tab_nationality, tab_bubble, tab_demo = st.tabs(
+        ["Age Statistics", "Age Distribution", "Nationality by Gender", "Mean Age Bubbles", "Full Demographics"],
+        key="dashboard_chart_tab", on_change="rerun"
+    )
 
-    plt.figure(figsize=(14,6))
-    sns.lineplot(data=df_Age, x='العمر Age', y='count', marker="o", color="blue")
-    plt.axvline(stats["mean"], color="red", linestyle=":", label=f"Mean: {stats['mean']:.2f}")
-    plt.axvline(stats["median"], color="orange", linestyle="-", label=f"Median: {stats['median']:.2f}")
-    plt.axvline(stats["mode"], color="purple", linestyle="--", label=f"Mode: {stats['mode']:.2f}")
-    plt.axvline(stats["q1"], color="green", linestyle="--", label=f"Q1: {stats['q1']:.2f}")
-    plt.axvline(stats["q3"], color="green", linestyle="--", label=f"Q3: {stats['q3']:.2f}")
-    plt.xlabel("Age")
-    plt.ylabel("Count")
-    plt.title("Age Distribution with Statistical Markers")
-    plt.legend()
-    plt.tight_layout()
-    st.pyplot(plt.gcf())
-    plt.clf()
-
-    st.markdown("---")  # separator
+    # ---- 1. Age Distribution Stats (Matplotlib) ----
+    if tab_stats.open:
+        with tab_stats:
+            # Exact statistics from (age, count) pairs, without expanding one row per pilgrim
+            stats = views.memo("age_stats", lambda: weighted_summary(df_Age['العمر Age'], df_Age['count']))
+            # The line charts only need the shape, so dense series are thinned before plotting
+            age_line = views.memo("age_line", lambda: decimate(df_Age, 'العمر Age', 'count'))
+            st.image(views.memo("age_png", lambda: age_distribution_png(age_line, stats)), width="stretch")
 
     # ---- 2. Plotly Line Chart of Age Distribution ----
-    fig_age_dist = px.line(df_Age, x='العمر Age', y='count', markers=True,
-        title="Age Distribution", labels={'العمر Age': "Age", 'count': "Count"})
-    fig_age_dist.update_layout(template="plotly_dark", height=450)
-    st.plotly_chart(fig_age_dist, use_container_width=True)
-
-    st.markdown("---")
+    if tab_age.open:
+        with tab_age:
+            age_line = views.memo("age_line", lambda: decimate(df_Age, 'العمر Age', 'count'))
+            fig_age_dist = views.memo("age_line_figure", lambda: age_line_figure(age_line))
+            st.plotly_chart(fig_age_dist, width="stretch")
 
     # ---- 3. Nationality by Gender (with bilingual gender labels) ----
-    fig_hist = px.histogram(
-        filtered_df, x='الجنسية Nationality', color='Gender_English',
-        barmode="group",
-        title="DEMOGRAPHICS OF NATIONALITY BY GENDER",
-        labels={'Gender_English': "Gender", 'الجنسية Nationality': "Nationality"}
-    )
-    fig_hist.update_layout(template="plotly_white", height=450)
-    st.plotly_chart(fig_hist, use_container_width=True)
-
-    st.markdown("---")
+    if tab_nationality.open:
+        with tab_nationality:
+            fig_hist = views.memo("nationality_gender_figure", lambda: nationality_gender_figure(views.nationality_gender()))
+            st.plotly_chart(fig_hist, width="stretch")
+            st.caption(f"Chart payload: {figure_payload_bytes(fig_hist) / 1024:.1f} KB")
 
     # ---- 4. Bubble Chart: Nationality & Gender by Mean Age ----
-    agg = filtered_df.groupby(['الجنسية Nationality', 'Gender_English']).agg(
-        count=('العمر Age', 'count'),
-        avg_age=('العمر Age', 'mean')).reset_index()
-    agg['avg_age'] = agg['avg_age'].round(1)
-    fig_bubble = px.scatter(
-        agg, x='الجنسية Nationality', y='count', size='avg_age',
-        color='الجنسية Nationality', facet_col='Gender_English',
-        title="Nationality and Gender by Mean Age", size_max=30,
-        labels={'count': 'Count', 'الجنسية Nationality': 'Nationality'}
-    )
-    fig_bubble.update_layout(template="plotly_dark", height=500)
-    st.plotly_chart(fig_bubble, use_container_width=True)
-
-    st.markdown("---")
+    if tab_bubble.open:
+        with tab_bubble:
+            fig_bubble = views.memo("mean_age_figure", lambda: mean_age_bubble_figure(views.mean_age()))
+            st.plotly_chart(fig_bubble, width="stretch")
 
     # ---- 5. Full Demographics (Age, Gender, Nationality) ----
-    fig_demo = px.histogram(
-        filtered_df, x='العمر Age', color='الجنسية Nationality', facet_col='Gender_English',
-        barmode="overlay", title="Demographic Characteristics: Age, Gender, Nationality"
-    )
-    fig_demo.update_layout(template="ggplot2", height=500)
-    st.plotly_chart(fig_demo, use_container_width=True)
+    if tab_demo.open:
+        with tab_demo:
+            # Ages are binned server-side, so the figure carries one bar per bin rather than one value per pilgrim
+            fig_demo = views.memo("demographics_figure", lambda: demographics_figure(views.age_nationality_gender()))
+            st.plotly_chart(fig_demo, width="stretch")
+            st.caption(f"Chart payload: {figure_payload_bytes(fig_demo) / 1024:.1f} KB")
 
     st.markdown("---")
 
-    if st.button("Back to Home"):
-        st.session_state.page = "home"
-
 
 # -- ROUTING TO THE MAIN APP
 def main():
@@ -450,103 +435,47 @@ def analyze():
         "General Services": ["general", "other"]
     }
 
-    primary_pipeline = pipeline("sentiment-analysis", model="distilbert/distilbert-base-uncased-finetuned-sst-2-english", framework="pt")
-    cache = {}
-
-    def translator_dual(text, src="auto", dest="en"):
-        if pd.isnull(text): return None, None
-        text = str(text).strip()
-        if text not in cache:
-            try: cache[text] = GoogleTranslator(source=src, target=dest).translate(text)
-            except Exception as e: cache[text] = f"Error: {e}"
-        return text, cache[text]
-
-    def classify_department(comment):
-        tokens = set(comment.lower().split())
-        for theme, keywords in themes_topics.items():
-            if any(keyword in tokens for keyword in keywords):
-                return theme
-        return "General Services"
-
-    def analyze_primary_sentiment(comment):
-        result = primary_pipeline(comment)[0]
-        return result["label"], round(result["score"], 2)
-
-    def extract_comments_in_chunks(file, chunksize=10000):
-        filename = file.name.lower()
-        if filename.endswith(".pdf"):
-            with pdfplumber.open(file) as pdf:
-                text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-            lines = [line.strip() for line in text.split("\n") if line.strip()]
-            yield pd.DataFrame({"Comments": lines})
-        elif filename.endswith(".txt"):
-            text = file.read().decode("utf-8")
-            lines = [line.strip() for line in text.split("\n") if line.strip()]
-            yield pd.DataFrame({"Comments": lines})
-        elif filename.endswith(".csv"):
-            for chunk in pd.read_csv(file, chunksize=chunksize):
-                chunk.columns = [col.strip() for col in chunk.columns]
-                if "Comments" in chunk.columns:
-                    yield chunk[["Comments"]]
-        elif filename.endswith(".xlsx"):
-            df = pd.read_excel(file)
-            if "Comments" in df.columns:
-                yield df[["Comments"]]
-        elif filename.endswith(".json"):
-            df = pd.read_json(file)
-            if "Comments" in df.columns:
-                yield df[["Comments"]]
-        else:
-            st.warning("Unsupported file format.")
-            yield None
-
-    def process_chunk(chunk):
-        chunk[["Original", "Translated"]] = chunk["Comments"].apply(lambda c: pd.Series(translator_dual(c)))
-        chunk["Department"] = chunk["Translated"].apply(classify_department)
-        chunk[["Primary Sentiment", "Confidence"]] = chunk["Translated"].apply(lambda c: pd.Series(analyze_primary_sentiment(c)))
-        return chunk
-
-    uploaded_file = st.file_uploader("📂Upload CSV, Excel, PDF, TXT, or JSON", type=["csv", "xlsx", "pdf", "txt", "json"])
+    comment_pipeline = load_pipeline(themes_topics)
+
+    uploaded_file = st.file_uploader("📂Upload CSV, Excel, PDF, TXT, or JSON (plain or .gz/.zip/.zst)", type=["csv", "xlsx", "pdf", "txt", "json", "jsonl"] + ARCHIVE_TYPES)
     manual_input = st.text_area("Type or paste/enter comments manually (one per line):", height=200)
 
     if uploaded_file:
-        results = []
-        total_rows_estimate = 1_000_000
-        progress_bar = st.progress(0)
-        rows_processed = 0
-        for chunk in extract_comments_in_chunks(uploaded_file):
-            if chunk is None: break
-            processed = process_chunk(chunk)
-            results.append(processed)
-            rows_processed += len(processed)
-            progress_bar.progress(min(rows_processed / total_rows_estimate, 1.0))
-        if results:
-            df_results = pd.concat(results, ignore_index=True)
-            st.success(f"✅ Completed processing {rows_processed} rows!")
-            st.dataframe(df_results.head(1000))
-            csv = df_results.to_csv(index=False).encode("utf-8")
-            st.download_button("⬇️ Download Results", csv, "primary_model_results.csv", "text/csv")
+        # A background job does the work, so it carries on across reruns and page changes
+        run_key = (upload_hash(uploaded_file), comment_pipeline.fingerprint)
+        job = current_job(run_key, uploaded_file.name, analyze_upload(comment_pipeline, uploaded_file))
+    else:
+        # Back on the page without the upload: pick up this session's last job
+        job = current_job()
+    if job is not None and (uploaded_file or not manual_input.strip()):
+        run = job_status(job)
+        if run is not None:
+            writer, excel_writer, store = run
+            st.success(f"✅ Completed processing {writer.rows} rows!")
+            results_viewer(store)
+            # The file is read only when the button is clicked
+            st.download_button("⬇️ Download Results", writer.read_bytes, f"primary_model_results.{writer.fmt}", writer.mime)
+            st.download_button("⬇️ Download Excel", excel_writer.read_bytes, "primary_model_results.xlsx", excel_writer.mime)
     elif manual_input.strip():
         lines = [line.strip() for line in manual_input.split("\n") if line.strip()]
-        df_manual = pd.DataFrame({"Comments": lines})
         with st.spinner("Analyzing manual input..."):
-            df_results = process_chunk(df_manual)
+            df_results = run_cache.process_lines(comment_pipeline, lines)
         st.success("✅ Analysis complete!")
         st.dataframe(df_results)
         csv = df_results.to_csv(index=False).encode("utf-8")
         st.download_button("⬇️ Download CSV", csv, "manual_primary_results.csv", "text/csv")
+        # Built on click, away from the memoized upload runs and their files
+        st.download_button("⬇️ Download Excel", partial(excel_bytes, df_results), "manual_primary_results.xlsx", EXCEL_MIME)
     else:
         st.info("📂 Upload a file or enter comments above to get started.")
 
 # --- BACKGROUND CSS FOR ANALYZE PAGE ---
 def add_bg_from_local(image_file):
-    with open(image_file, "rb") as img_file:
-        encoded_string = base64.b64encode(img_file.read()).decode()
     st.markdown(
         f"""
         <style>
         .stApp {{
-            background-image: url("data:image/png;base64,{encoded_string}");
+            background-image: url("{asset_url(image_file)}");
             background-size: cover;
             background-position: center;
             background-repeat: no-repeat;
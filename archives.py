@@ -0,0 +1,52 @@
+# archives.py
+
+import gzip
+import io
+import zipfile
+
+ARCHIVE_SUFFIXES = (".gz", ".zip", ".zst", ".zstd")
+ARCHIVE_TYPES = ["gz", "zip", "zst", "zstd"]
+
+
+def is_archive(filename) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_archive_members(file, filename=None):
+    """Yield (member name, binary stream) for each file inside a compressed upload.
+
+    Members are decompressed lazily as they are read, so callers that consume
+    the stream in chunks never hold the whole uncompressed file. A ``.gz`` or
+    ``.zst`` file has a single member named after the archive minus its suffix;
+    a ``.zip`` yields every regular file it contains. Anything else is yielded
+    unchanged.
+    """
+    filename = filename or file.name
+    lower = filename.lower()
+    if lower.endswith(".gz"):
+        with gzip.GzipFile(fileobj=file, mode="rb") as stream:
+            yield filename[:-3], stream
+    elif lower.endswith(".zip"):
+        with zipfile.ZipFile(file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                with archive.open(info) as stream:
+                    yield info.filename, stream
+    elif lower.endswith((".zst", ".zstd")):
+        import zstandard
+
+        with zstandard.ZstdDecompressor().stream_reader(file, closefd=False) as reader:
+            yield filename.rsplit(".", 1)[0], io.BufferedReader(reader)
+    else:
+        yield filename, file
+
+
+def seekable(stream):
+    """Return `stream` if it can seek, otherwise an in-memory copy of it.
+
+    PDF and Excel readers need random access; CSV/TXT/JSON readers do not.
+    """
+    if getattr(stream, "seekable", lambda: False)():
+        return stream
+    return io.BytesIO(stream.read())
@@ -0,0 +1,322 @@
+# batch.py
+#
+# Headless batch runner: the analyze page's extraction, translation,
+# classification and sentiment stages over files or directories, without Streamlit.
+#
+#   python batch.py comments/ -o results.parquet
+#   python batch.py a.csv b.jsonl.gz -o results.csv --workers 4 --batch-size 20000
+#   python batch.py comments/ -o results.parquet --translation-cache .cache/translations.sqlite
+#   python batch.py comments/ -o results.parquet --analytics-db .cache/history.duckdb
+#
+# With one worker, reading, translation, classification and scoring run side by
+# side on consecutive chunks in one process. With more, each worker process loads
+# its own copy of the model and runs whole chunks. Rows are written in input order.
+# Processed chunks are checkpointed: rerunning the same command after a crash
+# resumes from the first incomplete chunk, as long as inputs and settings are unchanged.
+# Every row is also recorded in the analytics store shared with the app.
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+
+from analytics_store import ANALYTICS_DB, AnalyticsStore
+from archives import is_archive
+from checkpoints import CHECKPOINT_DIR, Checkpoint
+from comment_pipeline import (COMMENT_SUFFIXES, PIPELINE_VERSION, PRIMARY_MODEL, CommentPipeline,
+                              extract_comments_in_chunks, has_failed_translations, translation_failed)
+from progress import ProgressTracker, estimate_total_rows
+from result_writer import RESULT_FORMATS, ResultWriter
+from stage_pipeline import Passed, Stage, run_stages
+
+DEFAULT_BATCH_SIZE = 10000
+# Extensions tried longest first, so results.csv.gz is csv.gz rather than csv
+OUTPUT_FORMATS = sorted(RESULT_FORMATS, key=len, reverse=True)
+SQLITE_MAX_PARAMS = 900
+
+
+class TranslationCache:
+    """Translations kept in a SQLite file, so later runs and other workers reuse them."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Workers share the file; wait for each other's writes instead of failing.
+        # Within a process, the translation threads take turns on one connection.
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS translations (text TEXT PRIMARY KEY, translated TEXT)")
+        self._db.commit()
+
+    def lookup(self, texts) -> dict:
+        found = {}
+        for start in range(0, len(texts), SQLITE_MAX_PARAMS):
+            batch = texts[start:start + SQLITE_MAX_PARAMS]
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT text, translated FROM translations WHERE text IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def store(self, translations):
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?)", translations.items())
+
+
+_pipeline = None
+_translations = None
+
+
+def _init_worker(themes_topics, model, translation_cache):
+    global _pipeline, _translations
+    _pipeline = CommentPipeline(themes_topics, model)
+    _translations = TranslationCache(translation_cache) if translation_cache else None
+
+
+def _translate(chunk):
+    """The pipeline's translation stage, with the SQLite translation cache in front of it."""
+    texts = chunk["Comments"].dropna().astype(str).str.strip().unique().tolist()
+    new = [text for text in texts if text not in _pipeline.cache]
+    if _translations is not None and new:
+        _pipeline.cache.update(_translations.lookup(new))
+        new = [text for text in new if text not in _pipeline.cache]
+    translated = _pipeline.translate_chunk(chunk)
+    if _translations is not None and new:
+        # Failed translations are retried next time rather than remembered
+        new = set(new)
+        _translations.store({
+            text: translation for text, translation in zip(translated["Original"], translated["Translated"])
+            if text in new and not translation_failed(translation)
+        })
+    return translated
+
+
+def _stages():
+    translation, *rest = _pipeline.stages()
+    return [Stage(translation.name, _translate, translation.workers), *rest]
+
+
+def _process(chunk):
+    """Run one chunk through the pipeline; return it with the chunk's stage timings."""
+    tracker = ProgressTracker()
+    for stage in _stages():
+        with tracker.stage(stage.name, len(chunk)):
+            chunk = stage.work(chunk)
+    return chunk, tracker.stages
+
+
+def find_inputs(paths):
+    """Comment files named on the command line, with directories searched recursively."""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(COMMENT_SUFFIXES) or is_archive(name.lower()):
+                    found.append(os.path.join(root, name))
+    return found
+
+
+def inputs_digest(inputs) -> str:
+    """Hash of the inputs' names and contents, read in blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in inputs:
+        digest.update(os.path.abspath(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_chunks(inputs, batch_size, tracker, sources):
+    """(row offset, chunk) over every input, numbered by their position in the whole run.
+
+    The input path of each chunk is appended to `sources`.
+    """
+    offset = 0
+    for path in inputs:
+        with open(path, "rb") as file:
+            for chunk in tracker.track("Extraction", extract_comments_in_chunks(file, batch_size)):
+                if chunk is None:
+                    print(f"Skipping {path}: unsupported file format", file=sys.stderr)
+                    break
+                if len(chunk):
+                    sources.append(path)
+                    yield offset, chunk.reset_index(drop=True)
+                    offset += len(chunk)
+
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _run_staged(chunks, init_args, checkpoint, tracker):
+    """`_run_chunks` in this process, the stages overlapping; timings go straight to `tracker`."""
+    _init_worker(*init_args)
+    offsets = []
+    resumed = set()
+
+    def pending():
+        for index, (offset, chunk) in enumerate(chunks):
+            offsets.append(offset)
+            if checkpoint is None:
+                yield chunk
+                continue
+            processed = checkpoint.load(index, offset, len(chunk))
+            if processed is None:
+                yield checkpoint.mark(chunk, index, offset)
+            else:
+                resumed.add(index)
+                yield Passed(processed)
+
+    stages = _stages()
+    if checkpoint is not None:
+        stages.append(checkpoint.stage(skip=has_failed_translations))
+    for index, processed in enumerate(run_stages(pending(), stages, tracker)):
+        yield index, offsets[index], processed, {}, index in resumed
+
+
+def _finished(index, offset, future, resumed, checkpoint):
+    processed, stages = future.result()
+    if checkpoint is not None and not resumed and not has_failed_translations(processed):
+        checkpoint.save(index, offset, processed)
+    return index, offset, processed, stages, resumed
+
+
+def _run_chunks(chunks, workers, init_args, checkpoint, tracker):
+    """(index, offset, processed, stage timings, resumed) in input order.
+
+    Chunks saved in `checkpoint` are loaded instead of processed, and the
+    others are saved to it once processed, unless a translation failed. With
+    several workers, at most two chunks are in flight per worker.
+    """
+    if workers <= 1:
+        yield from _run_staged(chunks, init_args, checkpoint, tracker)
+        return
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args)
+    try:
+        pending = deque()
+        for index, (offset, chunk) in enumerate(chunks):
+            processed = checkpoint.load(index, offset, len(chunk)) if checkpoint is not None else None
+            if processed is not None:
+                future = _completed((processed, {}))
+            else:
+                future = pool.submit(_process, chunk)
+            pending.append((index, offset, future, processed is not None))
+            if len(pending) >= 2 * workers:
+                yield _finished(*pending.popleft(), checkpoint)
+        while pending:
+            yield _finished(*pending.popleft(), checkpoint)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def output_format(path, fmt=None):
+    if fmt:
+        return fmt
+    for candidate in OUTPUT_FORMATS:
+        if path.lower().endswith(f".{candidate}"):
+            return candidate
+    raise ValueError(f"Cannot tell the output format of {path}; pass --format")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate, classify and score comment files without the UI.")
+    parser.add_argument("inputs", nargs="+", help="comment files or directories (CSV, Excel, PDF, TXT, JSON, archives)")
+    parser.add_argument("-o", "--output", required=True, help="results file, e.g. results.parquet or results.csv")
+    parser.add_argument("--format", choices=list(RESULT_FORMATS), help="output format (default: from the extension)")
+    parser.add_argument("--workers", type=int, default=1, help="processes running the pipeline (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="comments per chunk")
+    parser.add_argument("--model", default=PRIMARY_MODEL, help="sentiment model name or path")
+    parser.add_argument("--themes", help="JSON file of department -> keywords (default: themes.py)")
+    parser.add_argument("--model-cache", help="directory for downloaded models (sets HF_HOME)")
+    parser.add_argument("--translation-cache", help="SQLite file of translations reused across runs")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR, help="where processed chunks are saved for resuming")
+    parser.add_argument("--no-checkpoint", action="store_true", help="neither save nor resume from checkpoints")
+    parser.add_argument("--analytics-db", default=ANALYTICS_DB,
+                        help="analytics store the rows are recorded in (.duckdb or .sqlite)")
+    parser.add_argument("--no-analytics", action="store_true", help="do not record the rows in the analytics store")
+    parser.add_argument("--quiet", action="store_true", help="no progress lines on stderr")
+    args = parser.parse_args(argv)
+
+    try:
+        fmt = output_format(args.output, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("no comment files found")
+    if args.model_cache:
+        # Read when transformers is imported, so set it before any worker starts
+        os.environ["HF_HOME"] = os.path.abspath(args.model_cache)
+    if args.themes:
+        with open(args.themes, encoding="utf-8") as f:
+            themes_topics = json.load(f)
+    else:
+        from themes import themes_topics
+
+    total_rows = 0
+    for path in inputs:
+        with open(path, "rb") as file:
+            total_rows += estimate_total_rows(file) or 0
+    tracker = ProgressTracker(total_rows or None)
+    init_args = (themes_topics, args.model, args.translation_cache)
+    checkpoint = None
+    config = (PIPELINE_VERSION, json.dumps(themes_topics, sort_keys=True), args.model, args.batch_size)
+    # Reading every input to hash it is skipped when nothing needs the run's identity
+    run_key = None if args.no_checkpoint and args.no_analytics else (inputs_digest(inputs), config)
+    if not args.no_checkpoint:
+        checkpoint = Checkpoint(run_key, args.checkpoint_dir)
+        if checkpoint.completed and not args.quiet:
+            print(f"Resuming: {checkpoint.completed} chunk(s) already processed", file=sys.stderr)
+    sources = []
+    chunks = _read_chunks(inputs, args.batch_size, tracker, sources)
+    resumed_rows = 0
+    analytics = nullcontext() if args.no_analytics else AnalyticsStore(args.analytics_db).recorder(run_key, ", ".join(inputs))
+    with ResultWriter(fmt, preview_rows=0, path=args.output) as writer, analytics as recorder:
+        for index, offset, processed, stages, resumed in _run_chunks(chunks, args.workers, init_args, checkpoint, tracker):
+            if resumed:
+                resumed_rows += len(processed)
+            writer.write(processed)
+            if recorder is not None:
+                recorder.write(processed, sources[index])
+            tracker.advance(len(processed))
+            for name, (rows, seconds) in stages.items():
+                tracker.workers.setdefault(name, args.workers)
+                tracker.record(name, rows, seconds)
+            if not args.quiet:
+                print(tracker.summary(), file=sys.stderr, flush=True)
+
+    elapsed = tracker.elapsed
+    rate = tracker.rows_done / elapsed if elapsed else 0.0
+    print(f"Processed {tracker.rows_done:,} comments from {len(inputs)} file(s) in "
+          f"{elapsed:,.1f}s ({rate:,.1f} rows/s) with {args.workers} worker(s)")
+    # Stage rates are per worker; the overall rate above is what the run achieved.
+    # The busiest stage is the bottleneck.
+    for name, (rows, seconds) in tracker.stages.items():
+        print(f"  {name:<15} {rows:>12,} rows  {seconds:9.1f}s  {tracker.rows_per_second(name):>10,.1f} rows/s"
+              f"  {100 * tracker.utilization(name):5.1f}% busy")
+    if resumed_rows:
+        print(f"  {resumed_rows:,} rows were taken from checkpoints")
+    print(f"Wrote {writer.path}" if writer.rows else "No comments found; nothing written")
+    if recorder is not None and recorder.rows:
+        print(f"Recorded {recorder.rows:,} rows in {args.analytics_db}")
+    if checkpoint is not None:
+        checkpoint.clear()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
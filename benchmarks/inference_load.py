@@ -0,0 +1,122 @@
+# benchmarks/inference_load.py
+#
+# Load test for the sentiment micro-batcher: concurrent sessions each send
+# requests of a few comments; prints p50/p99 request latency and throughput with
+# one forward pass per comment (the old behaviour) and with micro-batching.
+#
+#   python benchmarks/inference_load.py                      # simulated model, no downloads
+#   python benchmarks/inference_load.py --model distilbert/distilbert-base-uncased-finetuned-sst-2-english
+#   python benchmarks/inference_load.py --sessions 20 --max-batch 64 --max-wait-ms 5
+#
+# The simulated model takes a fixed cost per forward pass plus a cost per text,
+# one pass at a time, like a single CPU or GPU.
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentiment_service import MAX_BATCH, MAX_WAIT_MS, MicroBatcher  # noqa: E402
+
+COMMENTS = [
+    "The buses were late and the driver did not know the route",
+    "Very clean rooms and friendly staff",
+    "Food was cold and the portions were small",
+    "Registration was quick and well organized",
+    "Nobody answered our questions at the reception",
+    "Excellent service throughout the journey",
+]
+
+
+class SimulatedModel:
+    """Sleeps `pass_ms` + `text_ms` per text for each call; one call at a time."""
+
+    def __init__(self, pass_ms, text_ms):
+        self.pass_seconds = pass_ms / 1000
+        self.text_seconds = text_ms / 1000
+        self._device = threading.Lock()
+
+    def __call__(self, texts, **kwargs):
+        with self._device:
+            time.sleep(self.pass_seconds + self.text_seconds * len(texts))
+        return [{"label": "POSITIVE", "score": 0.99} for _ in texts]
+
+
+def load_model(name):
+    from transformers import pipeline
+
+    model = pipeline("sentiment-analysis", model=name, framework="pt")
+    return lambda texts, **kwargs: model(texts, batch_size=len(texts))
+
+
+def run(score, sessions, requests, comments_per_request, seed=0):
+    """Latencies (seconds) of every request, and the wall time of the whole run."""
+    latencies = []
+    lock = threading.Lock()
+
+    def session(index):
+        rng = random.Random(seed + index)
+        for _ in range(requests):
+            texts = [rng.choice(COMMENTS) for _ in range(rng.randint(1, comments_per_request))]
+            start = time.perf_counter()
+            score(texts)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append((elapsed, len(texts)))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def report(label, latencies, wall, batcher=None):
+    seconds = [elapsed for elapsed, _ in latencies]
+    texts = sum(count for _, count in latencies)
+    line = (f"{label:<12} p50 {percentile(seconds, 50) * 1000:8.1f} ms   p99 {percentile(seconds, 99) * 1000:8.1f} ms"
+            f"   {texts / wall:9.1f} comments/s")
+    if batcher is not None:
+        line += f"   mean batch {batcher.mean_batch_size():.1f}"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and throughput of sentiment scoring under concurrent sessions.")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=20, help="requests per session")
+    parser.add_argument("--comments", type=int, default=10, help="most comments per request")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--model", help="Hugging Face model to load instead of the simulated one")
+    parser.add_argument("--pass-ms", type=float, default=8.0, help="simulated cost of a forward pass")
+    parser.add_argument("--text-ms", type=float, default=0.5, help="simulated cost per text in a pass")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model) if args.model else SimulatedModel(args.pass_ms, args.text_ms)
+    print(f"{args.sessions} sessions x {args.requests} requests of 1-{args.comments} comments")
+
+    # Before: every comment was its own forward pass
+    latencies, wall = run(lambda texts: [model([text]) for text in texts],
+                          args.sessions, args.requests, args.comments)
+    report("unbatched", latencies, wall)
+
+    batcher = MicroBatcher(model, args.max_batch, args.max_wait_ms)
+    latencies, wall = run(batcher.predict, args.sessions, args.requests, args.comments)
+    report("batched", latencies, wall, batcher)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# benchmarks/startup.py
+#
+# Cold-start benchmark: time to first render of each page, each run in a fresh
+# interpreter so every import is paid again, as after a container restart.
+#
+#   python benchmarks/startup.py                       # compare with startup_baseline.json
+#   python benchmarks/startup.py --record              # measure and overwrite the baseline
+#   python benchmarks/startup.py --simulated-model     # without transformers/torch or a download
+#
+# Exits non-zero when a page fails to render, has no baseline, or is slower than
+# its baseline by more than the tolerance. With --simulated-model the analysis
+# pages get the simulated model of inference_load.py in place of transformers, so
+# their own imports and rendering are timed but not the model's; the baseline
+# records which model it was measured with and only compares like with like.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+
+# (entry point, page) pairs; None renders the script without setting a page
+PAGES = [
+    ("ps.py", "home"),
+    ("ps.py", "dashboard"),
+    ("app.py", "home"),
+    ("app.py", "dashboard"),
+    ("app.py", "analyze"),
+    ("home.py", "home"),
+    ("home.py", "dashboard"),
+    ("home.py", "documentation"),
+    ("home.py", "analyze"),
+    ("streamlit_app.py", "home"),
+    ("streamlit_app.py", "documentation"),
+    ("sentiment.py", None),
+]
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 1.5  # allowed ratio to the baseline
+ABSOLUTE_SLACK = 0.25  # seconds; keeps sub-second pages from failing on noise
+
+
+def _simulate_model():
+    """Make `transformers.pipeline` return inference_load's SimulatedModel, costing no time."""
+    import types
+
+    from inference_load import SimulatedModel
+
+    def pipeline(*args, **kwargs):
+        model = SimulatedModel(pass_ms=0, text_ms=0)
+        model.model = types.SimpleNamespace(config=types.SimpleNamespace(_commit_hash=None))
+        return model
+
+    transformers = types.ModuleType("transformers")
+    transformers.pipeline = pipeline
+    sys.modules["transformers"] = transformers
+
+
+def _render_once(script, page, simulated_model=False):
+    """Child process: first render of `page`, printed as JSON."""
+    from streamlit.testing.v1 import AppTest
+
+    if simulated_model:
+        _simulate_model()
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, script), default_timeout=600)
+    if page is not None:
+        at.session_state["page"] = page
+    at.run()
+    elapsed = time.perf_counter() - start
+    errors = [str(e.value).splitlines()[0] for e in at.exception]
+    print(json.dumps({"seconds": elapsed, "error": errors[0] if errors else None}))
+
+
+def measure(script, page, repeat=DEFAULT_REPEAT, simulated_model=False):
+    """Median first-render time over `repeat` fresh processes, or (None, error)."""
+    times = []
+    command = [sys.executable, os.path.abspath(__file__), "--child", script, page or ""]
+    if simulated_model:
+        command.append("--simulated-model")
+    for _ in range(repeat):
+        result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        lines = result.stdout.strip().splitlines()
+        if result.returncode != 0 or not lines:
+            return None, (result.stderr.strip().splitlines() or ["failed"])[-1]
+        outcome = json.loads(lines[-1])
+        if outcome["error"]:
+            return None, outcome["error"]
+        times.append(outcome["seconds"])
+    return statistics.median(times), None
+
+
+def _key(script, page):
+    return f"{script}:{page}" if page else script
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time to first render of each page, from a cold interpreter.")
+    parser.add_argument("--record", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--simulated-model", action="store_true",
+                        help="render the analysis pages with a simulated model instead of transformers")
+    parser.add_argument("--child", nargs=2, metavar=("SCRIPT", "PAGE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    model = "simulated" if args.simulated_model else "transformers"
+    if args.child:
+        _render_once(args.child[0], args.child[1] or None, args.simulated_model)
+        return 0
+
+    baseline = {}
+    if not args.record and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            recorded = json.load(f)
+        recorded_model = recorded.get("model", "transformers")
+        if recorded_model != model:
+            print(f"The baseline was measured with the {recorded_model} model and this run uses the {model} "
+                  "model; match it with --simulated-model or record a new baseline")
+            return 1
+        baseline = recorded.get("pages", {})
+
+    results, problems = {}, []
+    for script, page in PAGES:
+        key = _key(script, page)
+        seconds, error = measure(script, page, args.repeat, args.simulated_model)
+        if seconds is None:
+            problems.append(key)
+            print(f"{key:32} FAILED ({error})")
+            continue
+        results[key] = round(seconds, 3)
+        line = f"{key:32} {seconds:7.2f}s"
+        if key in baseline:
+            limit = baseline[key] * args.tolerance + ABSOLUTE_SLACK
+            line += f"   baseline {baseline[key]:.2f}s"
+            if seconds > limit:
+                problems.append(key)
+                line += f"   SLOWER than {limit:.2f}s"
+        elif not args.record:
+            problems.append(key)
+            line += "   NO BASELINE"
+        print(line)
+
+    if args.record:
+        if problems:
+            print("Baseline not written: every page must render")
+            return 1
+        record = {"python": platform.python_version(), "machine": platform.machine(), "model": model,
+                  "pages": results}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {os.path.relpath(BASELINE_PATH, ROOT)}")
+        return 0
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# checkpoints.py
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from stage_pipeline import Stage
+
+# Each processed chunk of a long run is saved as soon as it is done, so a run
+# that dies part way resumes from its first incomplete chunk instead of paying
+# for every translation again. Checkpoints are deleted once the run completes.
+CHECKPOINT_DIR = os.environ.get("PILGRIM_CHECKPOINT_DIR", os.path.join(".cache", "checkpoints"))
+MAX_CHECKPOINTS = 8  # unfinished runs kept; the oldest are deleted first
+
+_MANIFEST = "manifest.json"
+_POSITION = "checkpoint"  # DataFrame.attrs key of the (index, offset) set by `Checkpoint.mark`
+
+
+def _prune(directory, keep, current):
+    paths = sorted(glob.glob(os.path.join(directory, "*")), key=os.path.getmtime, reverse=True)
+    for path in [path for path in paths if path != current][keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class Checkpoint:
+    """The processed chunks of one run, kept on disk under a hash of `key`.
+
+    `key` must identify the input content and everything that affects the
+    output, including the chunk size, so chunk numbers mean the same rows on
+    every attempt. The manifest records each completed chunk's row offset and
+    length; a chunk whose offset or length no longer matches is processed again.
+    """
+
+    def __init__(self, key, directory=CHECKPOINT_DIR):
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+        self.path = os.path.join(directory, digest)
+        os.makedirs(self.path, exist_ok=True)
+        _prune(directory, MAX_CHECKPOINTS - 1, self.path)
+        self._chunks = {}
+        manifest = os.path.join(self.path, _MANIFEST)
+        if os.path.exists(manifest):
+            try:
+                with open(manifest, encoding="utf-8") as f:
+                    self._chunks = {int(index): entry for index, entry in json.load(f)["chunks"].items()}
+            except (OSError, ValueError, KeyError):
+                # An unreadable manifest only costs a full rerun
+                self._chunks = {}
+        os.utime(self.path)
+
+    @property
+    def completed(self) -> int:
+        """Number of chunks saved by earlier attempts."""
+        return len(self._chunks)
+
+    def _chunk_path(self, index):
+        return os.path.join(self.path, f"chunk-{index:06d}.pkl")
+
+    def load(self, index, offset, rows):
+        """The saved result of chunk `index`, or None if it has to be processed."""
+        entry = self._chunks.get(index)
+        if entry is None or entry != {"offset": offset, "rows": rows}:
+            return None
+        try:
+            return pd.read_pickle(self._chunk_path(index))
+        except Exception:
+            return None
+
+    def save(self, index, offset, processed):
+        """Persist chunk `index`, then record it in the manifest."""
+        path = self._chunk_path(index)
+        processed.to_pickle(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self._chunks[index] = {"offset": offset, "rows": len(processed)}
+        manifest = os.path.join(self.path, _MANIFEST)
+        with open(f"{manifest}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"chunks": self._chunks}, f)
+        os.replace(f"{manifest}.tmp", manifest)
+
+    def mark(self, chunk, index, offset):
+        """Tag `chunk` as chunk `index` at row `offset`, for `stage` to save once it is processed."""
+        chunk.attrs[_POSITION] = (index, offset)
+        return chunk
+
+    def stage(self, skip=None) -> Stage:
+        """The last `stage_pipeline.Stage` of a run: it saves each chunk tagged by `mark`.
+
+        A chunk is saved as soon as its last stage finishes, while later chunks
+        are still being processed, rather than when the run gets round to
+        writing it out. Chunks for which `skip(chunk)` is true are passed on
+        without being saved.
+        """
+        def save(chunk):
+            index, offset = chunk.attrs.pop(_POSITION)
+            if skip is None or not skip(chunk):
+                self.save(index, offset, chunk)
+            return chunk
+
+        return Stage("Checkpoint", save)
+
+    def clear(self):
+        """Delete the checkpoint once the run's results are complete."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._chunks = {}
@@ -0,0 +1,279 @@
+# comment_pipeline.py
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import pandas as pd
+
+from archives import is_archive, iter_archive_members, seekable
+from data_loader import AGE_COL, GENDER_COL, NATIONALITY_COL
+from sentiment_service import MicroBatcher
+from stage_pipeline import Stage, run_stages
+
+PRIMARY_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+# Part of every pipeline fingerprint: bump it when a change to the processing
+# below alters the results, so memoized runs are not reused
+PIPELINE_VERSION = 2
+# Translation waits on the network rather than the CPU, so several chunks are
+# translated at once while the model scores the ones before them
+TRANSLATION_WORKERS = int(os.environ.get("PILGRIM_TRANSLATION_WORKERS", "4"))
+# Translations kept in memory by each pipeline, the least recently used dropped first
+MAX_CACHED_TRANSLATIONS = int(os.environ.get("PILGRIM_TRANSLATION_CACHE", "100000"))
+# A failed translation is recorded as this prefix and the error message
+TRANSLATION_ERROR = "Error: "
+
+
+# --- FILE PROCESSING ---
+COMMENT_SUFFIXES = (".pdf", ".txt", ".csv", ".xlsx", ".json", ".jsonl")
+# Demographic columns an upload may have next to its comments are kept with them
+EXTRACTED_COLUMNS = ["Comments", NATIONALITY_COL, GENDER_COL, AGE_COL]
+
+
+def _extracted(frame):
+    """`frame`'s EXTRACTED_COLUMNS, or None if it has no Comments column.
+
+    pandas infers each chunk's dtypes on its own, so they are fixed here:
+    ages are numbers, anything else missing, and the other columns are text.
+    A Parquet or Arrow result file keeps the first chunk's types throughout.
+    """
+    frame.columns = [str(col).strip() for col in frame.columns]
+    if "Comments" not in frame.columns:
+        return None
+    frame = frame[[col for col in EXTRACTED_COLUMNS if col in frame.columns]].copy()
+    for col in frame.columns:
+        if col == AGE_COL:
+            frame[col] = pd.to_numeric(frame[col], errors="coerce").astype("float64")
+        else:
+            frame[col] = frame[col].astype("string")
+    return frame
+
+
+def _txt_chunks(file, chunksize):
+    text = io.TextIOWrapper(file, encoding="utf-8")
+    try:
+        lines = []
+        for line in text:
+            line = line.strip()
+            if line:
+                lines.append(line)
+            if len(lines) >= chunksize:
+                yield pd.DataFrame({"Comments": lines})
+                lines = []
+        if lines:
+            yield pd.DataFrame({"Comments": lines})
+    finally:
+        # Leave the underlying upload open for later reruns
+        text.detach()
+
+
+def extract_comments_in_chunks(file, chunksize=10000, filename=None):
+    """Yield DataFrames with a "Comments" column; yields None for unsupported files.
+
+    Nationality, gender and age columns are kept when the file has them.
+
+    Compressed uploads (.gz, .zip, .zst) are decompressed as a stream and each
+    member is read according to its own extension, skipping unsupported ones.
+    """
+    filename = (filename or file.name).lower()
+    if is_archive(filename):
+        for member_name, stream in iter_archive_members(file, filename):
+            if is_archive(member_name) or member_name.lower().endswith(COMMENT_SUFFIXES):
+                yield from extract_comments_in_chunks(stream, chunksize, filename=member_name)
+    elif filename.endswith(".pdf"):
+        import pdfplumber
+
+        with pdfplumber.open(seekable(file)) as pdf:
+            text = "\n".join(page.extract_text() or "" for page in pdf.pages)
+        lines = [line.strip() for line in text.split("\n") if line.strip()]
+        yield pd.DataFrame({"Comments": lines})
+    elif filename.endswith(".txt"):
+        yield from _txt_chunks(file, chunksize)
+    elif filename.endswith(".csv"):
+        for chunk in pd.read_csv(file, chunksize=chunksize):
+            chunk = _extracted(chunk)
+            if chunk is not None:
+                yield chunk
+    elif filename.endswith(".xlsx"):
+        df = _extracted(pd.read_excel(seekable(file)))
+        if df is not None:
+            yield df
+    elif filename.endswith(".jsonl"):
+        for chunk in pd.read_json(file, lines=True, chunksize=chunksize):
+            chunk = _extracted(chunk)
+            if chunk is not None:
+                yield chunk
+    elif filename.endswith(".json"):
+        df = _extracted(pd.read_json(file))
+        if df is not None:
+            yield df
+    else:
+        yield None
+
+
+def _untimed(name, rows):
+    return nullcontext()
+
+
+def translation_failed(translated) -> bool:
+    """Whether a Translated value records a failed translation."""
+    return isinstance(translated, str) and translated.startswith(TRANSLATION_ERROR)
+
+
+def has_failed_translations(chunk) -> bool:
+    """Whether any row of a processed chunk failed to translate, so it should not be reused."""
+    return bool(chunk["Translated"].map(translation_failed).any())
+
+
+class RecentTranslations:
+    """The `max_size` most recently used translations, shared by the translation threads.
+
+    Failed translations are never stored, so they are retried next time.
+    """
+
+    def __init__(self, max_size=MAX_CACHED_TRANSLATIONS):
+        self.max_size = max_size
+        self._translations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._translations)
+
+    def __contains__(self, text):
+        return text in self._translations
+
+    def get(self, text):
+        with self._lock:
+            translated = self._translations.get(text)
+            if translated is not None:
+                self._translations.move_to_end(text)
+            return translated
+
+    def put(self, text, translated):
+        if translated is None or translation_failed(translated):
+            return
+        with self._lock:
+            self._translations[text] = translated
+            self._translations.move_to_end(text)
+            while len(self._translations) > self.max_size:
+                self._translations.popitem(last=False)
+
+    def update(self, translations):
+        for text, translated in translations.items():
+            self.put(text, translated)
+
+    def clear(self):
+        with self._lock:
+            self._translations.clear()
+
+
+# --- TRANSLATION, CLASSIFICATION AND SENTIMENT ---
+class CommentPipeline:
+    """Translate, classify by department and score the sentiment of comments."""
+
+    def __init__(self, themes_topics, model=PRIMARY_MODEL):
+        # transformers (and torch) take seconds to import, so only pages that
+        # build a pipeline pay for them
+        from transformers import pipeline
+
+        self.themes_topics = themes_topics
+        self.primary_pipeline = pipeline("sentiment-analysis", model=model, framework="pt")
+        # Every caller of this pipeline shares one queue, so concurrent sessions
+        # get batched forward passes instead of one pass per comment
+        self.batcher = MicroBatcher(lambda texts: self.primary_pipeline(texts, batch_size=len(texts)))
+        self.cache = RecentTranslations()
+        # The resolved model revision, so an updated checkpoint changes the fingerprint
+        revision = getattr(self.primary_pipeline.model.config, "_commit_hash", None)
+        config = json.dumps([PIPELINE_VERSION, themes_topics, model, revision], sort_keys=True, ensure_ascii=False)
+        self.fingerprint = hashlib.blake2b(config.encode("utf-8"), digest_size=16).hexdigest()
+
+    def translator_dual(self, text, src="auto", dest="en"):
+        if pd.isnull(text): return None, None
+        text = str(text).strip()
+        # Read once: another thread may evict it in between
+        translated = self.cache.get(text)
+        if translated is None:
+            from deep_translator import GoogleTranslator
+            try: translated = GoogleTranslator(source=src, target=dest).translate(text)
+            except Exception as e: translated = f"{TRANSLATION_ERROR}{e}"
+            self.cache.put(text, translated)
+        return text, translated
+
+    def classify_department(self, comment):
+        tokens = set(comment.lower().split())
+        for theme, keywords in self.themes_topics.items():
+            if any(keyword in tokens for keyword in keywords):
+                return theme
+        return "General Services"
+
+    def analyze_primary_sentiment(self, comment):
+        return self.analyze_primary_sentiments([comment])[0]
+
+    def analyze_primary_sentiments(self, comments):
+        """(label, confidence) per comment, scored in micro-batches."""
+        return [(result["label"], round(result["score"], 2)) for result in self.batcher.predict(comments)]
+
+    def translate_chunk(self, chunk):
+        """Add the Original and Translated columns."""
+        chunk[["Original", "Translated"]] = chunk["Comments"].apply(lambda c: pd.Series(self.translator_dual(c)))
+        return chunk
+
+    def classify_chunk(self, chunk):
+        """Add the Department column."""
+        chunk["Department"] = chunk["Translated"].apply(self.classify_department)
+        return chunk
+
+    def score_chunk(self, chunk):
+        """Add the Primary Sentiment and Confidence columns."""
+        scores = self.analyze_primary_sentiments(chunk["Translated"].tolist())
+        chunk["Primary Sentiment"] = [label for label, _ in scores]
+        chunk["Confidence"] = [confidence for _, confidence in scores]
+        return chunk
+
+    def stages(self, translation_workers=TRANSLATION_WORKERS) -> list:
+        """The processing stages, in order, as `stage_pipeline.Stage`s."""
+        return [
+            Stage("Translation", self.translate_chunk, translation_workers),
+            Stage("Classification", self.classify_chunk),
+            Stage("Sentiment", self.score_chunk),
+        ]
+
+    def process_chunk(self, chunk, progress=None):
+        """Add Original/Translated/Department/Primary Sentiment/Confidence columns.
+
+        When a `progress.ProgressTracker` is given, each stage is timed on it.
+        """
+        stage = progress.stage if progress is not None else _untimed
+        for step in self.stages():
+            with stage(step.name, len(chunk)):
+                chunk = step.work(chunk)
+        return chunk
+
+    def process_chunks(self, chunks, progress=None, stages=()):
+        """`process_chunk` over `chunks`, with the stages working on different chunks at once.
+
+        `stages` run after the pipeline's own, such as `Checkpoint.stage`.
+        Yields the processed chunks in input order; see `stage_pipeline.run_stages`.
+        """
+        return run_stages(chunks, [*self.stages(), *stages], progress)
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def load_pipeline(themes_topics, model=PRIMARY_MODEL) -> CommentPipeline:
+    """The process-wide CommentPipeline for a configuration.
+
+    Built on first use and shared by every rerun and session afterwards, so
+    the model is loaded once rather than on each rerun.
+    """
+    key = (json.dumps(themes_topics, sort_keys=True), model)
+    with _pipelines_lock:
+        if key not in _pipelines:
+            _pipelines[key] = CommentPipeline(themes_topics, model)
+        return _pipelines[key]
@@ -0,0 +1,137 @@
+# dashboard_charts.py
+#
+# Plotly, seaborn and matplotlib are imported inside the functions that draw, so
+# importing this module (and starting a page that shows no chart) stays cheap.
+
+import io
+import math
+
+import numpy as np
+import pandas as pd
+
+from data_loader import AGE_COL, GENDER_ENGLISH_COL, NATIONALITY_COL
+from demographic_cube import COUNT_COL
+
+AGE_BIN_COL = "age_bin"
+TARGET_AGE_BINS = 40
+MAX_LINE_POINTS = 500
+
+
+def age_bin_width(ages, target_bins=TARGET_AGE_BINS) -> int:
+    """Whole-year bin width giving at most about `target_bins` bins."""
+    if ages.empty:
+        return 1
+    span = float(ages.max()) - float(ages.min()) + 1
+    return max(1, math.ceil(span / target_bins))
+
+
+def bin_age_counts(counts, bin_width=None):
+    """Sum pre-aggregated counts into fixed-width age bins, labelled by bin centre."""
+    counts = counts.dropna(subset=[AGE_COL])
+    bin_width = bin_width or age_bin_width(counts[AGE_COL])
+    ages = counts[AGE_COL].astype(int)
+    centres = (ages // bin_width) * bin_width + (bin_width - 1) / 2
+    by = [c for c in counts.columns if c not in (AGE_COL, COUNT_COL)]
+    binned = counts.assign(**{AGE_BIN_COL: centres}).groupby(by + [AGE_BIN_COL], observed=True)[COUNT_COL].sum()
+    return binned.reset_index(), bin_width
+
+
+def decimate(frame, x, y, max_points=MAX_LINE_POINTS):
+    """Thin a dense line series to about `max_points` points, sorted by `x`.
+
+    The series is split into max_points / 2 buckets, and each bucket keeps the
+    points where `y` is lowest and highest. Peaks and dips survive, and the
+    figure size stays bounded however many points there are.
+    """
+    frame = frame.sort_values(x)
+    if len(frame) <= max_points:
+        return frame
+    buckets = np.arange(len(frame)) * (max_points // 2) // len(frame)
+    grouped = pd.Series(frame[y].to_numpy(dtype=float)).groupby(buckets)
+    keep = np.unique(np.concatenate([grouped.idxmin(), grouped.idxmax(), [0, len(frame) - 1]]))
+    return frame.iloc[keep]
+
+
+def age_line_figure(counts):
+    """Line chart of pilgrims per age."""
+    import plotly.express as px
+
+    fig = px.line(counts, x=AGE_COL, y=COUNT_COL, markers=True,
+        title="Age Distribution", labels={AGE_COL: "Age", COUNT_COL: "Count"})
+    fig.update_layout(template="plotly_dark", height=450)
+    return fig
+
+
+def nationality_gender_figure(counts):
+    """Grouped bars of pilgrims per nationality and gender, from cube counts."""
+    import plotly.express as px
+
+    fig = px.bar(
+        counts, x=NATIONALITY_COL, y=COUNT_COL, color=GENDER_ENGLISH_COL,
+        barmode="group",
+        title="DEMOGRAPHICS OF NATIONALITY BY GENDER",
+        labels={GENDER_ENGLISH_COL: "Gender", NATIONALITY_COL: "Nationality"}
+    )
+    fig.update_layout(template="plotly_white", height=450)
+    return fig
+
+
+def mean_age_bubble_figure(agg):
+    """Bubbles sized by mean age, per nationality and gender, from `mean_age_by_nationality_gender`."""
+    import plotly.express as px
+
+    fig = px.scatter(
+        agg, x=NATIONALITY_COL, y=COUNT_COL, size="avg_age",
+        color=NATIONALITY_COL, facet_col=GENDER_ENGLISH_COL,
+        title="Nationality and Gender by Mean Age", size_max=30,
+        labels={COUNT_COL: "Count", NATIONALITY_COL: "Nationality"}
+    )
+    fig.update_layout(template="plotly_dark", height=500)
+    return fig
+
+
+def demographics_figure(counts, bin_width=None):
+    """Overlaid age histograms per nationality, faceted by gender, from pre-binned counts."""
+    import plotly.express as px
+
+    binned, bin_width = bin_age_counts(counts, bin_width)
+    fig = px.bar(
+        binned, x=AGE_BIN_COL, y=COUNT_COL, color=NATIONALITY_COL, facet_col=GENDER_ENGLISH_COL,
+        barmode="overlay", title="Demographic Characteristics: Age, Gender, Nationality",
+        labels={AGE_BIN_COL: AGE_COL}
+    )
+    fig.update_traces(width=bin_width)
+    fig.update_layout(template="ggplot2", height=500, bargap=0)
+    return fig
+
+
+def age_distribution_png(counts, stats, dpi=200) -> bytes:
+    """Render the age line plot with its statistical markers to PNG bytes.
+
+    Draws on its own `Figure` rather than pyplot's global one, so concurrent
+    sessions never draw into each other's figure and nothing has to be closed.
+    """
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(14, 6))
+    ax = fig.subplots()
+    sns.lineplot(data=counts, x=AGE_COL, y=COUNT_COL, marker="o", color="blue", ax=ax)
+    ax.axvline(stats["mean"], color="red", linestyle=":", label=f"Mean: {stats['mean']:.2f}")
+    ax.axvline(stats["median"], color="orange", linestyle="-", label=f"Median: {stats['median']:.2f}")
+    ax.axvline(stats["mode"], color="purple", linestyle="--", label=f"Mode: {stats['mode']:.2f}")
+    ax.axvline(stats["q1"], color="green", linestyle="--", label=f"Q1: {stats['q1']:.2f}")
+    ax.axvline(stats["q3"], color="green", linestyle="--", label=f"Q3: {stats['q3']:.2f}")
+    ax.set_xlabel("Age")
+    ax.set_ylabel("Count")
+    ax.set_title("Age Distribution with Statistical Markers")
+    ax.legend()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def figure_payload_bytes(fig) -> int:
+    """Size of the figure JSON that is sent to the browser."""
+    return len(fig.to_json().encode("utf-8"))
@@ -0,0 +1,104 @@
+# data_loader.py
+
+import pandas as pd
+
+from archives import is_archive, iter_archive_members, seekable
+
+# Columns the demographics dashboard reads; everything else in an upload is skipped
+AGE_COL = "العمر Age"
+NATIONALITY_COL = "الجنسية Nationality"
+GENDER_COL = "الجنس Gender"
+REQUIRED_COLS = [AGE_COL, NATIONALITY_COL, GENDER_COL]
+CATEGORY_COLS = [NATIONALITY_COL, GENDER_COL]
+GENDER_ENGLISH_COL = "Gender_English"
+GENDER_MAP = {'أنثى': 'أنثى : Female', 'ذكر': 'ذكر: Male'}
+
+
+def is_dashboard_column(name) -> bool:
+    """Column filter for `usecols`: the required columns plus any date column."""
+    name = str(name).strip()
+    return name in REQUIRED_COLS or "date" in name.lower()
+
+
+def date_columns(dataset: pd.DataFrame) -> list:
+    """Columns the dashboard treats as dates (any header containing 'date')."""
+    return [c for c in dataset.columns if "date" in c.lower()]
+
+
+def compact_age(ages: pd.Series) -> pd.Series:
+    """Convert ages to the smallest nullable unsigned integer type that fits."""
+    ages = pd.to_numeric(ages, errors="coerce").round()
+    ages = ages.where(ages >= 0)
+    dtype = "UInt16" if ages.max() > 255 else "UInt8"
+    return ages.astype(dtype)
+
+
+def prepare_dashboard_frame(dataset: pd.DataFrame) -> pd.DataFrame:
+    """Project a loaded frame to the dashboard columns, apply compact dtypes and
+    add the derived gender labels and parsed dates the charts use."""
+    dataset.columns = dataset.columns.astype(str).str.strip()
+    dataset = dataset[[c for c in dataset.columns if is_dashboard_column(c)]].copy()
+    for col in CATEGORY_COLS:
+        if col in dataset.columns and not isinstance(dataset[col].dtype, pd.CategoricalDtype):
+            dataset[col] = dataset[col].astype("category")
+    if AGE_COL in dataset.columns:
+        dataset[AGE_COL] = compact_age(dataset[AGE_COL])
+    if GENDER_COL in dataset.columns:
+        # Bilingual gender labels used by the charts
+        dataset[GENDER_ENGLISH_COL] = dataset[GENDER_COL].map(GENDER_MAP)
+    for col in date_columns(dataset):
+        dataset[col] = pd.to_datetime(dataset[col], errors="coerce")
+    return dataset
+
+
+def concat_dashboard_frames(frames) -> pd.DataFrame:
+    """Concatenate prepared frames, keeping the categorical columns categorical."""
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames, ignore_index=True)
+    for col in CATEGORY_COLS + [GENDER_ENGLISH_COL]:
+        if col in combined.columns and not isinstance(combined[col].dtype, pd.CategoricalDtype):
+            combined[col] = combined[col].astype("category")
+    return combined
+
+
+def read_dashboard_csv(source, **kwargs) -> pd.DataFrame:
+    """Read CSV/TXT data for the dashboard, loading only the columns it uses.
+
+    Undecodable bytes are replaced instead of failing the whole load, and a
+    UTF-8 byte order mark is dropped so it cannot hide the first header.
+    """
+    dataset = pd.read_csv(
+        source,
+        usecols=is_dashboard_column,
+        dtype={col: "category" for col in CATEGORY_COLS},
+        encoding="utf-8-sig",
+        encoding_errors="replace",
+        **kwargs,
+    )
+    return prepare_dashboard_frame(dataset)
+
+
+def read_dashboard_excel(source, **kwargs) -> pd.DataFrame:
+    """Read an Excel/ODS sheet for the dashboard, loading only the columns it uses."""
+    dataset = pd.read_excel(source, usecols=is_dashboard_column, **kwargs)
+    return prepare_dashboard_frame(dataset)
+
+
+def read_dashboard_archive(source, filename=None) -> pd.DataFrame:
+    """Read every CSV/TXT/Excel member of a .gz, .zip or .zst upload for the dashboard.
+
+    CSV members are parsed straight from the decompressing stream.
+    """
+    frames = []
+    for member_name, stream in iter_archive_members(source, filename):
+        member_type = member_name.lower().rsplit(".", 1)[-1]
+        if is_archive(member_name):
+            frames.append(read_dashboard_archive(stream, member_name))
+        elif member_type in ("csv", "txt"):
+            frames.append(read_dashboard_csv(stream))
+        elif member_type in ("xls", "xlsx", "ods"):
+            frames.append(read_dashboard_excel(seekable(stream)))
+    if not frames:
+        raise ValueError("No CSV or Excel data found in the compressed file.")
+    return concat_dashboard_frames(frames)
@@ -0,0 +1,141 @@
+# demographic_cube.py
+
+import threading
+
+import pandas as pd
+
+from data_loader import AGE_COL, GENDER_COL, GENDER_ENGLISH_COL, NATIONALITY_COL
+from filter_index import FilterIndex
+
+COUNT_COL = "count"
+DATE_BUCKET_COL = "date_bucket"
+OTHER_LABEL = "Other"
+TOP_NATIONALITIES = 15
+DIMENSIONS = [NATIONALITY_COL, GENDER_COL, GENDER_ENGLISH_COL, AGE_COL]
+
+
+def build_cube(dataset: pd.DataFrame, date_column=None, date_freq="D") -> pd.DataFrame:
+    """Count pilgrims per Nationality × Gender × Age (× date bucket).
+
+    The cube has one row per distinct combination, so every dashboard filter
+    and chart can be answered from it in time proportional to the number of
+    groups rather than the number of pilgrims. Missing values are kept as
+    their own groups so totals still match the row-level data.
+    """
+    keys = [dataset[col] for col in DIMENSIONS]
+    if date_column:
+        keys.append(dataset[date_column].dt.floor(date_freq).rename(DATE_BUCKET_COL))
+    cube = dataset.groupby(keys, observed=True, dropna=False).size().rename(COUNT_COL).reset_index()
+    return cube[cube[COUNT_COL] > 0].reset_index(drop=True)
+
+
+def build_filter_index(cube) -> FilterIndex:
+    """Gender/nationality bitmaps and a date-sorted index over the cube rows."""
+    date_column = DATE_BUCKET_COL if DATE_BUCKET_COL in cube.columns else None
+    return FilterIndex(cube, [GENDER_COL, NATIONALITY_COL], date_column)
+
+
+def filter_cube(cube, genders, nationalities, date_range=None, index=None) -> pd.DataFrame:
+    """Restrict the cube to the selected genders, nationalities and date range.
+
+    The date range is compared per bucket, so both end dates are inclusive.
+    Pass the cube's `index` (see `build_filter_index`) to resolve the filters
+    from bitmaps instead of comparing every row.
+    """
+    if index is not None:
+        return cube[index.resolve({GENDER_COL: genders, NATIONALITY_COL: nationalities}, date_range)]
+    mask = cube[GENDER_COL].isin(genders) & cube[NATIONALITY_COL].isin(nationalities)
+    if date_range is not None and len(date_range) == 2 and DATE_BUCKET_COL in cube.columns:
+        start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+        mask &= (cube[DATE_BUCKET_COL] >= start_date) & (cube[DATE_BUCKET_COL] <= end_date)
+    return cube[mask]
+
+
+def filter_key(genders, nationalities, date_range=None) -> tuple:
+    """Hashable key for a filter selection; the order of selected values does not matter."""
+    dates = tuple(pd.to_datetime(d) for d in date_range) if date_range is not None else None
+    return frozenset(genders), frozenset(nationalities), dates
+
+
+def top_nationalities(cube, n=TOP_NATIONALITIES) -> pd.DataFrame:
+    """Fold all but the `n` most frequent nationalities into one "Other" nationality.
+
+    Keeps nationality charts to at most n + 1 categories however many distinct
+    nationalities the data has; totals are unchanged.
+    """
+    totals = cube.groupby(NATIONALITY_COL, observed=True)[COUNT_COL].sum()
+    if len(totals) <= n:
+        return cube
+    keep = totals.nlargest(n).index
+    nationality = cube[NATIONALITY_COL].astype(object)
+    folded = nationality.where(nationality.isin(keep) | nationality.isna(), OTHER_LABEL)
+    categories = list(dict.fromkeys([*keep, OTHER_LABEL]))
+    return cube.assign(**{NATIONALITY_COL: folded.astype(pd.CategoricalDtype(categories))})
+
+
+def _counts(cube, by) -> pd.DataFrame:
+    return cube.groupby(by, observed=True)[COUNT_COL].sum().reset_index()
+
+
+def age_counts(cube) -> pd.DataFrame:
+    """Pilgrims per age, sorted by age (ages that are missing are left out)."""
+    return _counts(cube.dropna(subset=[AGE_COL]), AGE_COL).sort_values(AGE_COL)
+
+
+def nationality_gender_counts(cube) -> pd.DataFrame:
+    """Pilgrims per nationality and bilingual gender label."""
+    return _counts(cube, [NATIONALITY_COL, GENDER_ENGLISH_COL])
+
+
+def age_nationality_gender_counts(cube) -> pd.DataFrame:
+    """Pilgrims per age, nationality and bilingual gender label."""
+    return _counts(cube, [AGE_COL, NATIONALITY_COL, GENDER_ENGLISH_COL])
+
+
+def mean_age_by_nationality_gender(cube) -> pd.DataFrame:
+    """Pilgrims with a known age, and their mean age, per nationality and gender."""
+    aged = cube.dropna(subset=[AGE_COL])
+    aged = aged.assign(age_sum=aged[AGE_COL].astype(float) * aged[COUNT_COL])
+    agg = aged.groupby([NATIONALITY_COL, GENDER_ENGLISH_COL], observed=True)[[COUNT_COL, "age_sum"]].sum().reset_index()
+    agg["avg_age"] = (agg["age_sum"] / agg[COUNT_COL]).round(1)
+    return agg.drop(columns="age_sum")
+
+
+class DashboardViews:
+    """The aggregates behind the dashboard charts, for one filtered cube.
+
+    Each aggregate is computed the first time it is asked for and kept, so a
+    chart that is never opened costs nothing. `memo` keeps anything else
+    derived from these aggregates, such as figures, in the same place.
+    With `top_n`, the per-nationality aggregates show the top_n nationalities
+    and an "Other" bucket.
+    """
+
+    def __init__(self, cube, top_n=None):
+        self.cube = cube
+        self.top_n = top_n
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def memo(self, name, compute):
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+        value = compute()
+        with self._lock:
+            return self._values.setdefault(name, value)
+
+    def _nationality_cube(self):
+        return self.memo("nationality_cube", lambda: top_nationalities(self.cube, self.top_n) if self.top_n else self.cube)
+
+    def age(self) -> pd.DataFrame:
+        return self.memo("age", lambda: age_counts(self.cube))
+
+    def nationality_gender(self) -> pd.DataFrame:
+        return self.memo("nationality_gender", lambda: nationality_gender_counts(self._nationality_cube()))
+
+    def mean_age(self) -> pd.DataFrame:
+        return self.memo("mean_age", lambda: mean_age_by_nationality_gender(self._nationality_cube()))
+
+    def age_nationality_gender(self) -> pd.DataFrame:
+        return self.memo("age_nationality_gender", lambda: age_nationality_gender_counts(self._nationality_cube()))
@@ -0,0 +1,78 @@
+# filter_index.py
+
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    """Bitmap and sorted-date index over the rows of a frame.
+
+    Every distinct value of an indexed column gets a packed bitmap (one bit per
+    row), and row positions are kept sorted by date. A filter combination then
+    resolves with bitmap ORs within a column, ANDs across columns and a binary
+    search for the date range, instead of string comparisons and date scans.
+    Build it once per dataset; resolving is independent of how many values
+    are selected in a multiselect.
+    """
+
+    def __init__(self, frame: pd.DataFrame, columns, date_column=None):
+        self.size = len(frame)
+        self.bitmaps = {}
+        self._complete = {}
+        for col in columns:
+            self.bitmaps[col] = self._value_bitmaps(frame[col])
+            # Without missing values, selecting every value restricts nothing
+            self._complete[col] = not frame[col].isna().any()
+
+        self._date_order = None
+        if date_column is not None and date_column in frame.columns:
+            dates = frame[date_column].to_numpy(dtype="datetime64[ns]")
+            order = np.argsort(dates, kind="stable")
+            # NaT sorts last; rows without a date never fall inside a range
+            self._date_order = order[~np.isnat(dates[order])]
+            self._sorted_dates = dates[self._date_order]
+
+    def _value_bitmaps(self, series) -> dict:
+        categorical = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+        codes = categorical.cat.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(categorical.cat.categories) + 1))
+        bitmaps = {}
+        for code, value in enumerate(categorical.cat.categories):
+            if bounds[code + 1] > bounds[code]:
+                bitmaps[value] = self._pack(order[bounds[code]:bounds[code + 1]])
+        return bitmaps
+
+    def _pack(self, positions) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return np.packbits(mask)
+
+    def _column_bitmap(self, column, selected):
+        bitmaps = self.bitmaps[column]
+        chosen = [bitmaps[value] for value in set(selected) if value in bitmaps]
+        if len(chosen) == len(bitmaps) and self._complete[column]:
+            return None
+        if not chosen:
+            return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(chosen)
+
+    def _date_bitmap(self, date_range) -> np.ndarray:
+        start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+        lo = np.searchsorted(self._sorted_dates, start_date.to_datetime64(), side="left")
+        hi = np.searchsorted(self._sorted_dates, end_date.to_datetime64(), side="right")
+        return self._pack(self._date_order[lo:hi])
+
+    def resolve(self, selections, date_range=None) -> np.ndarray:
+        """Boolean row mask for `{column: selected values}` and an inclusive (start, end) range."""
+        combined = None
+        for column, selected in selections.items():
+            bitmap = self._column_bitmap(column, selected)
+            if bitmap is not None:
+                combined = bitmap if combined is None else combined & bitmap
+        if date_range is not None and len(date_range) == 2 and self._date_order is not None:
+            bitmap = self._date_bitmap(date_range)
+            combined = bitmap if combined is None else combined & bitmap
+        if combined is None:
+            return np.ones(self.size, dtype=bool)
+        return np.unpackbits(combined, count=self.size).astype(bool)
@@ -0,0 +1,164 @@
+# ingest_cache.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Parsed datasets are kept in memory per process; set PILGRIM_PARQUET_CACHE=1 to
+# also keep a Parquet sidecar on disk so restarts skip the parse as well.
+CACHE_DIR = os.environ.get("PILGRIM_CACHE_DIR", os.path.join(".cache", "ingest"))
+PERSIST_PARQUET = os.environ.get("PILGRIM_PARQUET_CACHE", "0") == "1"
+MAX_ENTRIES = 8
+MAX_VIEWS = 64
+MAX_UPLOAD_DIGESTS = 256  # every upload of every session gets a new file id
+
+
+def content_hash(payload) -> str:
+    """Return a hex digest identifying the content of an upload or API payload."""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+_upload_digests = OrderedDict()
+_upload_digests_lock = threading.Lock()
+
+
+def upload_hash(uploaded_file) -> str:
+    """Hash a Streamlit upload once; later reruns reuse the digest by file id.
+
+    The digests of the MAX_UPLOAD_DIGESTS most recently used file ids are kept.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is not None:
+        with _upload_digests_lock:
+            if file_id in _upload_digests:
+                _upload_digests.move_to_end(file_id)
+                return _upload_digests[file_id]
+    digest = content_hash(uploaded_file.getvalue())
+    if file_id is not None:
+        with _upload_digests_lock:
+            _upload_digests[file_id] = digest
+            _upload_digests.move_to_end(file_id)
+            while len(_upload_digests) > MAX_UPLOAD_DIGESTS:
+                _upload_digests.popitem(last=False)
+    return digest
+
+
+class IngestCache:
+    """Parsed, typed DataFrames keyed by the content hash of their source."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, cache_dir=CACHE_DIR, max_views=MAX_VIEWS):
+        self.max_entries = max_entries
+        self.max_views = max_views
+        self.cache_dir = cache_dir
+        self._frames = OrderedDict()
+        self._derived = OrderedDict()
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, digest, loader, persist=None) -> pd.DataFrame:
+        """Return the frame for `digest`, calling `loader()` only on a miss.
+
+        Callers must treat the returned frame as read-only: it is shared by
+        every rerun and session that loads the same content.
+        """
+        with self._lock:
+            if digest in self._frames:
+                self._frames.move_to_end(digest)
+                return self._frames[digest]
+
+        persist = PERSIST_PARQUET if persist is None else persist
+        frame = self._read_sidecar(digest) if persist else None
+        if frame is None:
+            frame = loader()
+            if persist:
+                self._write_sidecar(digest, frame)
+
+        with self._lock:
+            self._frames[digest] = frame
+            self._frames.move_to_end(digest)
+            while len(self._frames) > self.max_entries:
+                self._frames.popitem(last=False)
+        return frame
+
+    def derive(self, digest, key, compute):
+        """Return a value computed from the dataset `digest`, calling `compute()` once.
+
+        Used for per-dataset artifacts such as aggregate cubes and indexes, which
+        stay valid for as long as the content hash is unchanged.
+        """
+        with self._lock:
+            values = self._derived.get(digest)
+            if values is not None and key in values:
+                self._derived.move_to_end(digest)
+                return values[key]
+
+        value = compute()
+
+        with self._lock:
+            self._derived.setdefault(digest, {})[key] = value
+            self._derived.move_to_end(digest)
+            while len(self._derived) > self.max_entries:
+                self._derived.popitem(last=False)
+        return value
+
+    def derive_view(self, digest, key, compute):
+        """Like `derive`, for small per-filter results of the dataset `digest`.
+
+        Every filter combination gets its own entry, so these are kept in one
+        LRU of at most `max_views` entries across all datasets instead of living
+        as long as the dataset's cube and indexes.
+        """
+        view_key = (digest, key)
+        with self._lock:
+            if view_key in self._views:
+                self._views.move_to_end(view_key)
+                return self._views[view_key]
+
+        value = compute()
+
+        with self._lock:
+            self._views[view_key] = value
+            self._views.move_to_end(view_key)
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._derived.clear()
+            self._views.clear()
+
+    def _sidecar_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.parquet")
+
+    def _read_sidecar(self, digest):
+        path = self._sidecar_path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            # A corrupt or unreadable sidecar is just a cache miss
+            return None
+
+    def _write_sidecar(self, digest, frame):
+        path = self._sidecar_path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            # Parquet support (pyarrow) is optional; the in-memory cache still applies
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+# Module state survives Streamlit reruns, so one instance serves the whole process
+ingest_cache = IngestCache()
@@ -0,0 +1,241 @@
+# jobs.py
+
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics_store import analytics_store
+from checkpoints import Checkpoint
+from comment_pipeline import extract_comments_in_chunks, has_failed_translations
+from progress import ProgressTracker, estimate_total_rows
+from result_writer import ExcelResultWriter, ResultStore, ResultWriter
+from run_cache import run_cache
+from stage_pipeline import Passed
+
+# Uploads are processed by background jobs rather than in the script run, so a
+# rerun, an autorefresh tick or leaving the page does not stop them.
+JOB_WORKERS = int(os.environ.get("PILGRIM_JOB_WORKERS", "1"))
+MAX_JOBS = 32  # finished jobs kept for status and results; active jobs are never dropped
+# Small enough that even a modest upload has chunks in every stage at once; a
+# cancelled job stops once its current chunks are done
+JOB_CHUNK_ROWS = 500
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+log = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised by `Job.check` once the job has been cancelled."""
+
+
+class Job:
+    """One unit of background work: its status, progress and result.
+
+    `work(job)` runs on a worker thread. It reports progress on `job.tracker`
+    and calls `job.check()` between steps so cancellation can stop it.
+    `watchers` are those waiting on the job; see `JobQueue.release`.
+    """
+
+    def __init__(self, key, name, work):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.name = name
+        self.status = QUEUED
+        self.tracker = ProgressTracker()
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.watchers = set()
+        self._work = work
+        self._cancel = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def _run(self):
+        if self._cancel.is_set():
+            self.status = CANCELLED
+            self.finished = time.time()
+            return
+        self.status = RUNNING
+        self.started = time.time()
+        try:
+            self.result = self._work(self)
+            self.status = DONE
+        except JobCancelled:
+            self.status = CANCELLED
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            self.status = FAILED
+        finally:
+            self.finished = time.time()
+
+
+class JobQueue:
+    """Background jobs run on a small thread pool, shared by every session of the process."""
+
+    def __init__(self, workers=JOB_WORKERS, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="pilgrim-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, name, work, watcher=None) -> Job:
+        """Queue `work` under `key`, or return the queued or running job already doing it.
+
+        `watcher`, such as a session's id, is added to the job's watchers.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == key and job.active and not job.cancelled:
+                    if watcher is not None:
+                        job.watchers.add(watcher)
+                    return job
+            job = Job(key, name, work)
+            if watcher is not None:
+                job.watchers.add(watcher)
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, other in self._jobs.items() if not other.active]
+            for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+                del self._jobs[job_id]
+        self._pool.submit(job._run)
+        return job
+
+    def release(self, job, watcher):
+        """`watcher` no longer waits on `job`; a job left with no watchers is cancelled.
+
+        A cancelled upload job keeps its checkpoints, so submitting it again
+        resumes it.
+        """
+        with self._lock:
+            job.watchers.discard(watcher)
+            if not job.watchers and job.active:
+                job.cancel()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+class _Recording:
+    """An `analytics_store` recorder that cannot fail the job it records.
+
+    The results a job returns do not depend on the analytics copy, so when
+    recording fails, for example because a batch run holds the store's lock
+    past the timeout, the error is logged and the rest of the run is not
+    recorded.
+    """
+
+    def __init__(self, key, source_file):
+        self._recorder = analytics_store.recorder(key, source_file)
+        self._active = False
+
+    def __enter__(self):
+        self._active = self._attempt(self._recorder.__enter__)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._active:
+            self._attempt(self._recorder.__exit__, exc_type, exc, tb)
+        return False
+
+    def write(self, chunk):
+        if self._active and not self._attempt(self._recorder.write, chunk):
+            self._active = False
+            # Removes what was recorded so far, if the store lets it
+            self._attempt(self._recorder.__exit__, RuntimeError, None, None)
+
+    def _attempt(self, action, *args):
+        try:
+            action(*args)
+            return True
+        except Exception:
+            log.exception("Recording %s in the analytics store failed; the analysis goes on without it",
+                          self._recorder.source_file)
+            return False
+
+
+def analyze_upload(pipeline, uploaded_file, chunksize=JOB_CHUNK_ROWS):
+    """Job work that runs an upload through `pipeline` into the result files.
+
+    The upload's bytes are captured now, so the job does not depend on the
+    session that submitted it. Processed chunks are checkpointed, so a job for
+    the same key after a crash, restart or cancel resumes where the last one
+    stopped. The finished run goes to `run_cache` under the job's key, and a
+    later job for the same key returns it straight away. Chunks with failed
+    translations are not checkpointed, and a run with any is not reused from
+    `run_cache`, so the next job retries them. Every row is also recorded in
+    `analytics_store`, replacing an earlier recording of the run; failing to
+    record is logged rather than failing the job.
+    """
+    file = io.BytesIO(uploaded_file.getvalue())
+    file.name = uploaded_file.name
+
+    def work(job):
+        run = run_cache.get(job.key)
+        if run is not None:
+            return run
+        job.tracker = ProgressTracker(estimate_total_rows(file))
+        checkpoint = Checkpoint((job.key, chunksize))
+        failed = False
+
+        def chunks():
+            offset = 0
+            for index, chunk in enumerate(job.tracker.track("Extraction", extract_comments_in_chunks(file, chunksize))):
+                job.check()
+                if chunk is None:
+                    raise ValueError("Unsupported file format.")
+                processed = checkpoint.load(index, offset, len(chunk))
+                if processed is None:
+                    yield checkpoint.mark(chunk, index, offset)
+                else:
+                    yield Passed(processed)
+                offset += len(chunk)
+
+        # Each processed chunk goes straight to disk, so only the few chunks
+        # between stages are held in memory
+        with ResultWriter() as writer, ExcelResultWriter() as excel_writer, ResultStore() as store, \
+                _Recording(job.key, file.name) as recorder:
+            stages = [checkpoint.stage(skip=has_failed_translations)]
+            for processed in pipeline.process_chunks(chunks(), job.tracker, stages):
+                job.check()
+                failed = failed or has_failed_translations(processed)
+                writer.write(processed)
+                excel_writer.write(processed)
+                store.write(processed)
+                recorder.write(processed)
+                job.tracker.advance(len(processed))
+        if not writer.rows:
+            raise ValueError("No comments found in the upload.")
+        checkpoint.clear()
+        return run_cache.put(job.key, (writer, excel_writer, store), reuse=not failed)
+
+    return work
+
+
+# Module state survives Streamlit reruns, so one queue serves the whole process
+job_queue = JobQueue()
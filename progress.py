@@ -0,0 +1,214 @@
+# progress.py
+
+import io
+import struct
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+from archives import is_archive, iter_archive_members
+
+SCAN_BLOCK_SIZE = 1 << 20
+SAMPLE_SIZE = 64 * 1024
+TEXT_SUFFIXES = (".csv", ".txt", ".json", ".jsonl")
+
+
+def _count_newlines(file) -> int:
+    count = 0
+    last = b""
+    for block in iter(lambda: file.read(SCAN_BLOCK_SIZE), b""):
+        count += block.count(b"\n")
+        last = block
+    # A final line without a trailing newline is still a line
+    if last and not last.endswith(b"\n"):
+        count += 1
+    return count
+
+
+def _count_pdf_rows(file) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(file) as pdf:
+        pages = len(pdf.pages)
+        if not pages:
+            return 0
+        # Lines per page are sampled from the first page rather than extracting them all
+        first = pdf.pages[0].extract_text() or ""
+    return pages * sum(1 for line in first.split("\n") if line.strip())
+
+
+def _count_excel_rows(file) -> int:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True)
+    try:
+        # Only the first sheet is read by pd.read_excel; its dimension is stored in the file
+        return max(workbook.worksheets[0].max_row - 1, 0)
+    finally:
+        workbook.close()
+
+
+def _sample_rows(stream, size) -> int:
+    # Extrapolate from the line length in the first decompressed block
+    sample = stream.read(SAMPLE_SIZE)
+    if not sample:
+        return 0
+    return max(int(size * sample.count(b"\n") / len(sample)), 1)
+
+
+def _uncompressed_size(file, filename):
+    lower = filename.lower()
+    if lower.endswith(".gz"):
+        # ISIZE trailer: uncompressed size modulo 2**32
+        file.seek(-4, io.SEEK_END)
+        return struct.unpack("<I", file.read(4))[0]
+    if lower.endswith((".zst", ".zstd")):
+        import zstandard
+
+        size = zstandard.frame_content_size(file.read(18))
+        return size if size >= 0 else None
+    return None
+
+
+def _count_archive_rows(file):
+    if file.name.lower().endswith(".zip"):
+        total = None
+        with zipfile.ZipFile(file) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(TEXT_SUFFIXES):
+                    continue
+                with archive.open(info) as stream:
+                    total = (total or 0) + _sample_rows(stream, info.file_size)
+        return total
+    size = _uncompressed_size(file, file.name)
+    file.seek(0)
+    if size is None:
+        return None
+    for member_name, stream in iter_archive_members(file):
+        if member_name.lower().endswith(TEXT_SUFFIXES):
+            return _sample_rows(stream, size)
+    return None
+
+
+def estimate_total_rows(file):
+    """Quickly estimate how many comment rows an upload holds, or None if unknown.
+
+    CSV/TXT/JSONL count newlines, Excel reads the sheet dimension, PDF multiplies the
+    page count by the first page's line count and JSON counts "Comments" keys.
+    Compressed uploads take their uncompressed size from the archive metadata
+    and extrapolate from the first decompressed block. The file position is
+    restored to the start afterwards.
+    """
+    filename = file.name.lower()
+    try:
+        file.seek(0)
+        if is_archive(filename):
+            return _count_archive_rows(file)
+        if filename.endswith(".csv"):
+            return max(_count_newlines(file) - 1, 0)
+        if filename.endswith((".txt", ".jsonl")):
+            return _count_newlines(file)
+        if filename.endswith(".xlsx"):
+            return _count_excel_rows(file)
+        if filename.endswith(".pdf"):
+            return _count_pdf_rows(file)
+        if filename.endswith(".json"):
+            return sum(block.count(b'"Comments"') for block in iter(lambda: file.read(SCAN_BLOCK_SIZE), b""))
+    except Exception:
+        return None
+    finally:
+        file.seek(0)
+    return None
+
+
+def _format_duration(seconds) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressTracker:
+    """Rows done against an estimated total, with per-stage throughput and an ETA."""
+
+    def __init__(self, total_rows=None):
+        self.total_rows = total_rows
+        self.rows_done = 0
+        self.started = time.perf_counter()
+        # stage name -> [rows, seconds]
+        self.stages = {}
+        # stage name -> threads or processes running it; 1 when not set
+        self.workers = {}
+        # Stages of a staged run report from several threads at once
+        self._lock = threading.Lock()
+
+    def record(self, name, rows, seconds):
+        """Add `rows` rows and `seconds` seconds of work to stage `name`."""
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += rows
+            totals[1] += seconds
+
+    @contextmanager
+    def stage(self, name, rows):
+        """Time a block of work that handles `rows` rows in stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, rows, time.perf_counter() - start)
+
+    def track(self, name, chunks):
+        """Iterate over `chunks`, timing each fetch as stage `name`."""
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, len(chunk) if chunk is not None else 0, time.perf_counter() - start)
+            yield chunk
+
+    def advance(self, rows):
+        self.rows_done += rows
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def fraction(self) -> float:
+        if not self.total_rows:
+            return 0.0
+        # Keep the bar short of full until the run really finishes
+        return min(self.rows_done / self.total_rows, 0.99)
+
+    def eta(self):
+        """Seconds left at the overall rate so far, or None if it cannot be told."""
+        if not self.total_rows or not self.rows_done:
+            return None
+        remaining = max(self.total_rows - self.rows_done, 0)
+        return remaining * self.elapsed / self.rows_done
+
+    def rows_per_second(self, name) -> float:
+        rows, seconds = self.stages.get(name, (0, 0.0))
+        return rows / seconds if seconds else 0.0
+
+    def utilization(self, name) -> float:
+        """Share of the elapsed time stage `name` kept its workers busy.
+
+        The busiest stage is the bottleneck: speeding up the others will not
+        make the run faster.
+        """
+        _, seconds = self.stages.get(name, (0, 0.0))
+        elapsed = self.elapsed
+        return min(seconds / (elapsed * self.workers.get(name, 1)), 1.0) if elapsed else 0.0
+
+    def summary(self) -> str:
+        total = f"{self.total_rows:,}" if self.total_rows else "?"
+        parts = [f"{self.rows_done:,} / ~{total} rows", f"elapsed {_format_duration(self.elapsed)}"]
+        eta = self.eta()
+        if eta is not None:
+            parts.append(f"ETA {_format_duration(eta)}")
+        parts.extend(f"{name} {self.rows_per_second(name):,.0f} rows/s" for name in list(self.stages))
+        return " · ".join(parts)
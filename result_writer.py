@@ -0,0 +1,487 @@
+# result_writer.py
+
+import glob
+import gzip
+import os
+import pathlib
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import closing
+
+import pandas as pd
+
+# Processed chunks are appended to a file as soon as they are done, so memory
+# holds one chunk (plus a small preview) however large the upload is. Parquet and
+# Arrow need pyarrow; set PILGRIM_RESULT_FORMAT to choose one of RESULT_FORMATS.
+RESULTS_DIR = os.environ.get("PILGRIM_RESULTS_DIR", os.path.join(".cache", "results"))
+RESULT_FORMAT = os.environ.get("PILGRIM_RESULT_FORMAT", "csv.gz")
+PREVIEW_ROWS = 1000
+
+RESULT_FORMATS = {
+    "csv.gz": "application/gzip",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXCEL_COLUMNS = ["Original", "Translated", "Department", "Primary Sentiment", "Confidence"]
+EXCEL_MAX_ROWS = 1_048_576  # per sheet, including the header row
+
+STORE_MIME = "application/vnd.sqlite3"
+# Display name -> SQLite column of the results table
+STORE_COLUMNS = {
+    "Original": "original",
+    "Translated": "translated",
+    "Department": "department",
+    "Primary Sentiment": "sentiment",
+    "Confidence": "confidence",
+}
+# Indexed, so ordering a page by them does not sort the whole table
+STORE_SORT_COLUMNS = ["Department", "Primary Sentiment", "Confidence"]
+
+
+# Result files are deleted with their run when run_cache evicts it. Files an
+# earlier process left behind have no run any more and go the first time this
+# process writes to their directory.
+_STARTED = time.time()
+_swept = set()
+
+
+def _sweep(directory):
+    """Delete the files in `directory` that earlier processes left, once per process."""
+    if directory in _swept:
+        return
+    _swept.add(directory)
+    for path in glob.glob(os.path.join(directory, "*")):
+        try:
+            if os.path.getmtime(path) < _STARTED:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ResultWriter:
+    """Append processed chunks to a results file on disk, one chunk at a time.
+
+    Use as a context manager; the file is written under a temporary name and
+    only appears at `path` once every chunk is in. The first `preview_rows`
+    rows are kept in memory for display. Without an explicit `path` the file
+    gets a unique name in `directory`; whoever keeps the writer deletes the
+    file with `delete` once it is no longer offered, as `run_cache` does.
+    """
+
+    formats = RESULT_FORMATS
+
+    def __init__(self, fmt=RESULT_FORMAT, directory=RESULTS_DIR, preview_rows=PREVIEW_ROWS, path=None):
+        if fmt not in self.formats:
+            raise ValueError(f"Unsupported result format: {fmt}")
+        self.fmt = fmt
+        self.mime = self.formats[fmt]
+        if path is None:
+            os.makedirs(directory, exist_ok=True)
+            _sweep(directory)
+            path = os.path.join(directory, f"{uuid.uuid4().hex}.{fmt}")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._part_path = f"{self.path}.part"
+        self.preview_rows = preview_rows
+        self._preview = []
+        self._preview_len = 0
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+        self._columns = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+        return False
+
+    def write(self, chunk: pd.DataFrame):
+        if self._columns is None:
+            self._columns = list(chunk.columns)
+        elif list(chunk.columns) != self._columns:
+            # Archive members can differ in their demographic columns; the file keeps the first chunk's
+            chunk = chunk.reindex(columns=self._columns)
+        self._write(chunk)
+        self.rows += len(chunk)
+        if self._preview_len < self.preview_rows:
+            head = chunk.head(self.preview_rows - self._preview_len)
+            self._preview.append(head)
+            self._preview_len += len(head)
+
+    def _write(self, chunk):
+        if self.fmt in ("csv.gz", "csv"):
+            if self._file is None:
+                opener = gzip.open if self.fmt == "csv.gz" else open
+                self._file = opener(self._part_path, "wt", encoding="utf-8", newline="")
+            chunk.to_csv(self._file, header=self.rows == 0, index=False)
+        else:
+            self._write_arrow(chunk)
+
+    def _write_arrow(self, chunk):
+        import pyarrow as pa
+
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            # An all-empty column in the first chunk must not fix its type to null
+            self._schema = pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema
+            ]).remove_metadata()
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+
+                self._writer = pq.ParquetWriter(self._part_path, self._schema, compression="zstd")
+            else:
+                options = pa.ipc.IpcWriteOptions(compression="zstd")
+                self._writer = pa.ipc.new_file(self._part_path, self._schema, options=options)
+        try:
+            table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            table = pa.Table.from_pandas(self._conformed(chunk), schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def _conformed(self, chunk):
+        """`chunk` with columns the file's schema cannot take as they are coerced to it.
+
+        Values that are not numbers become missing in a numeric column, and
+        anything else is written as text in a text column.
+        """
+        import pyarrow as pa
+
+        chunk = chunk.copy()
+        for field in self._schema:
+            try:
+                pa.array(chunk[field.name], type=field.type, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                column = chunk[field.name]
+                if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                    column = pd.to_numeric(column, errors="coerce")
+                    if pa.types.is_integer(field.type):
+                        # Fractions and missing values fit an integer column only as missing
+                        column = column.where(column == column.round()).astype("Int64")
+                    chunk[field.name] = column
+                elif pa.types.is_string(field.type):
+                    chunk[field.name] = column.astype("string")
+        return chunk
+
+    def close(self):
+        self._finish()
+        if os.path.exists(self._part_path):
+            os.replace(self._part_path, self.path)
+
+    def _finish(self):
+        if self._file is not None:
+            self._file.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def _abort(self):
+        try:
+            self._finish()
+        finally:
+            if os.path.exists(self._part_path):
+                os.remove(self._part_path)
+
+    @property
+    def preview(self) -> pd.DataFrame:
+        """The first `preview_rows` rows written."""
+        return pd.concat(self._preview, ignore_index=True) if self._preview else pd.DataFrame()
+
+    def delete(self):
+        """Remove the finished file."""
+        for path in (self.path, self._part_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def read_bytes(self) -> bytes:
+        """The finished file; pass the method itself to `st.download_button` to read it on click."""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ExcelResultWriter(ResultWriter):
+    """Stream the classification table into an .xlsx workbook in constant memory.
+
+    Rows go through xlsxwriter's `constant_memory` mode, which flushes each row
+    to disk once the next one starts. Past Excel's row limit the table continues
+    on "Results 2", "Results 3", and so on. The "Summary" sheet comes first and is
+    filled on close from counts kept while writing, not from a second pass.
+    """
+
+    formats = {"xlsx": EXCEL_MIME}
+
+    def __init__(self, directory=RESULTS_DIR, preview_rows=PREVIEW_ROWS, columns=EXCEL_COLUMNS,
+                 max_rows=EXCEL_MAX_ROWS):
+        super().__init__("xlsx", directory, preview_rows)
+        self.columns = columns
+        self.max_rows = max_rows
+        self._workbook = None
+        self._sheet = None
+        self._sheet_row = 0
+        self._sheets = 0
+        self._counts = {}
+        self._confidence = {}
+
+    def _open(self):
+        import xlsxwriter
+
+        self._workbook = xlsxwriter.Workbook(self._part_path, {
+            "constant_memory": True,
+            # Comments are text: never turn them into formulas, numbers or links
+            "strings_to_formulas": False,
+            "strings_to_numbers": False,
+            "strings_to_urls": False,
+        })
+        self._bold = self._workbook.add_format({"bold": True})
+        self._summary = self._workbook.add_worksheet("Summary")
+
+    def _next_sheet(self):
+        self._sheets += 1
+        name = "Results" if self._sheets == 1 else f"Results {self._sheets}"
+        self._sheet = self._workbook.add_worksheet(name)
+        self._sheet.write_row(0, 0, self.columns, self._bold)
+        self._sheet_row = 1
+
+    def _write(self, chunk):
+        if self._workbook is None:
+            self._open()
+        table = chunk.reindex(columns=self.columns)
+        # Blank cells for missing values; xlsxwriter rejects NaN
+        table = table.astype(object).where(table.notna(), None)
+        for values in table.itertuples(index=False, name=None):
+            if self._sheet is None or self._sheet_row >= self.max_rows:
+                self._next_sheet()
+            self._sheet.write_row(self._sheet_row, 0, values)
+            self._sheet_row += 1
+        self._aggregate(chunk)
+
+    def _aggregate(self, chunk):
+        keys = chunk.reindex(columns=["Department", "Primary Sentiment"]).fillna("(none)")
+        for key, count in keys.groupby(["Department", "Primary Sentiment"]).size().items():
+            self._counts[key] = self._counts.get(key, 0) + int(count)
+        if "Confidence" in chunk.columns:
+            confidence = pd.to_numeric(chunk["Confidence"], errors="coerce")
+            by_sentiment = confidence.groupby(keys["Primary Sentiment"]).agg(["sum", "count"])
+            for sentiment, (total, count) in by_sentiment.iterrows():
+                running = self._confidence.setdefault(sentiment, [0.0, 0])
+                running[0] += float(total)
+                running[1] += int(count)
+
+    def _write_summary(self):
+        sheet, bold = self._summary, self._bold
+        sheet.write_row(0, 0, ["Rows processed", self.rows], bold)
+        departments = sorted({department for department, _ in self._counts})
+        sentiments = sorted({sentiment for _, sentiment in self._counts})
+        sheet.write_row(2, 0, ["Department", *sentiments, "Total"], bold)
+        row = 3
+        for department in departments:
+            counts = [self._counts.get((department, sentiment), 0) for sentiment in sentiments]
+            sheet.write_row(row, 0, [department, *counts, sum(counts)])
+            row += 1
+        row += 1
+        sheet.write_row(row, 0, ["Primary Sentiment", "Comments", "Mean Confidence"], bold)
+        for sentiment in sentiments:
+            total, count = self._confidence.get(sentiment, (0.0, 0))
+            row += 1
+            sheet.write_row(row, 0, [sentiment, count, round(total / count, 4) if count else None])
+
+    def _finish(self):
+        if self._workbook is None:
+            return
+        self._write_summary()
+        self._workbook.close()
+
+
+def excel_bytes(frame: pd.DataFrame) -> bytes:
+    """`frame` as an ExcelResultWriter workbook, for small tables such as manual input.
+
+    The workbook is built in a scratch directory, not RESULTS_DIR, so it never
+    takes the place of a run's files. Pass `functools.partial(excel_bytes, frame)`
+    to `st.download_button` to build it only when the button is clicked.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with ExcelResultWriter(directory, preview_rows=0) as writer:
+            writer.write(frame)
+        return writer.read_bytes()
+
+
+class ResultStore(ResultWriter):
+    """Keep the classification table in SQLite so it can be paged, sorted and filtered.
+
+    Department, Primary Sentiment and Confidence are indexed and the comment text
+    gets a full-text index when SQLite has FTS5, so a page request reads the rows
+    it returns rather than the whole table. Query the finished store with `count`
+    and `page`; pages are fetched by key, from the row before or after them, never
+    by skipping rows.
+    """
+
+    formats = {"sqlite": STORE_MIME}
+
+    def __init__(self, directory=RESULTS_DIR):
+        super().__init__("sqlite", directory, preview_rows=0)
+        self._db = None
+        self.full_text = False
+        # Filters -> matching rows; the finished table never changes
+        self._counts = {}
+
+    def _open(self):
+        self._db = sqlite3.connect(self._part_path)
+        # A partial file is discarded on failure, so skip the journal while loading
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute(
+            "CREATE TABLE results (id INTEGER PRIMARY KEY, original TEXT, translated TEXT,"
+            " department TEXT, sentiment TEXT, confidence REAL)"
+        )
+
+    def _write(self, chunk):
+        if self._db is None:
+            self._open()
+        table = chunk.reindex(columns=list(STORE_COLUMNS))
+        table = table.astype(object).where(table.notna(), None)
+        self._db.executemany(
+            "INSERT INTO results (original, translated, department, sentiment, confidence) VALUES (?, ?, ?, ?, ?)",
+            table.itertuples(index=False, name=None),
+        )
+
+    def _finish(self):
+        if self._db is None:
+            return
+        # Indexes are built once after loading, which is faster than maintaining them per row
+        for column in (STORE_COLUMNS[sort] for sort in STORE_SORT_COLUMNS):
+            self._db.execute(f"CREATE INDEX results_{column} ON results ({column})")
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE results_text USING fts5(original, translated,"
+                " content='results', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            self._db.execute("INSERT INTO results_text (results_text) VALUES ('rebuild')")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: keyword search falls back to LIKE
+            self.full_text = False
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+    def _connect(self):
+        uri = pathlib.Path(os.path.abspath(self.path)).as_uri() + "?mode=ro"
+        return sqlite3.connect(uri, uri=True)
+
+    def distinct(self, column) -> list:
+        """Sorted distinct non-empty values of a display column, read from its index."""
+        name = STORE_COLUMNS[column]
+        with closing(self._connect()) as db:
+            rows = db.execute(f"SELECT DISTINCT {name} FROM results WHERE {name} IS NOT NULL ORDER BY {name}")
+            return [value for value, in rows]
+
+    def _where(self, departments, sentiments, confidence, keyword):
+        clauses, params = [], []
+        for name, values in (("department", departments), ("sentiment", sentiments)):
+            if values is not None:
+                clauses.append(f"{name} IN ({', '.join('?' * len(values))})" if values else "0")
+                params.extend(values)
+        if confidence is not None:
+            clauses.append("confidence BETWEEN ? AND ?")
+            params.extend(confidence)
+        terms = keyword.split() if keyword else []
+        if terms and self.full_text:
+            # Each word is matched as a quoted prefix, so user input is never FTS syntax
+            clauses.append("id IN (SELECT rowid FROM results_text WHERE results_text MATCH ?)")
+            params.append(" ".join('"{}"*'.format(term.replace('"', '""')) for term in terms))
+            terms = []
+        for term in terms:
+            pattern = "%{}%".format(term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+            clauses.append("(original LIKE ? ESCAPE '\\' OR translated LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        return clauses, params
+
+    def count(self, departments=None, sentiments=None, confidence=None, keyword=None) -> int:
+        """Number of rows matching the filters; see `page`. Counted once per set of filters."""
+        filters = (tuple(departments) if departments is not None else None,
+                   tuple(sentiments) if sentiments is not None else None,
+                   tuple(confidence) if confidence is not None else None, keyword or None)
+        if filters not in self._counts:
+            clauses, params = self._where(departments, sentiments, confidence, keyword)
+            where = " WHERE " + " AND ".join(clauses) if clauses else ""
+            with closing(self._connect()) as db:
+                self._counts[filters] = db.execute(f"SELECT COUNT(*) FROM results{where}", params).fetchone()[0]
+        return self._counts[filters]
+
+    @staticmethod
+    def _segments(column, descending, key):
+        """(clause, params) of the runs of rows after `key` in (column, id) order, in order.
+
+        SQLite sorts NULLs first, so they come last in descending order. Rows
+        with and without a value are read by separate queries, each a range
+        on the column's index (which holds the id too), because one clause
+        covering both is answered by scanning the index.
+        """
+        op = "<" if descending else ">"
+        if column is None:
+            return [(f"id {op} ?", [key[1]]) if key is not None else ("1", [])]
+        nulls = [(f"{column} IS NULL", [])]
+        values = [(f"{column} IS NOT NULL", [])]
+        if key is not None:
+            value, row_id = key
+            if value is None:
+                nulls = [(f"{column} IS NULL AND id {op} ?", [row_id])]
+                values = values if not descending else []
+            else:
+                values = [(f"({column}, id) {op} (?, ?)", [value, row_id])]
+                nulls = nulls if descending else []
+        return values + nulls if descending else nulls + values
+
+    @staticmethod
+    def key(frame, position, sort=None):
+        """The paging key of row `position` of a frame returned by `page`."""
+        value = frame[sort].iloc[position] if sort in STORE_SORT_COLUMNS else None
+        return (None if pd.isna(value) else value), int(frame.index[position])
+
+    def page(self, size=50, sort=None, descending=False, after=None, before=None, last=False, departments=None,
+             sentiments=None, confidence=None, keyword=None) -> pd.DataFrame:
+        """Up to `size` rows matching the filters, indexed by row id.
+
+        Rows are ordered by `sort`, one of STORE_SORT_COLUMNS, then by id;
+        without a sort they keep the order they were written in. The page starts
+        just after the row whose `key` is `after`, ends just before `before`, or
+        with `last` ends at the last row; with none of them it is the first page.
+        Filters left as None do not restrict; `confidence` is an inclusive
+        (low, high) range and `keyword` matches words in the original or
+        translated comment.
+        """
+        clauses, params = self._where(departments, sentiments, confidence, keyword)
+        column = STORE_COLUMNS[sort] if sort in STORE_SORT_COLUMNS else None
+        # Pages before a row, and the last page, are read backwards and then reversed
+        backwards = before is not None or last
+        reverse = descending != backwards
+        direction = "DESC" if reverse else "ASC"
+        order = f"{column} {direction}, id {direction}" if column else f"id {direction}"
+        columns = ", ".join(STORE_COLUMNS.values())
+        rows = []
+        with closing(self._connect()) as db:
+            for clause, seek_params in self._segments(column, reverse, after if after is not None else before):
+                if len(rows) >= size:
+                    break
+                rows += db.execute(
+                    f"SELECT id, {columns} FROM results WHERE {' AND '.join([*clauses, clause])}"
+                    f" ORDER BY {order} LIMIT ?",
+                    [*params, *seek_params, size - len(rows)],
+                ).fetchall()
+        if backwards:
+            rows.reverse()
+        frame = pd.DataFrame(rows, columns=["id", *STORE_COLUMNS])
+        return frame.set_index("id")
@@ -0,0 +1,157 @@
+# results_viewer.py
+
+import math
+import os
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+from jobs import CANCELLED, FAILED, QUEUED, job_queue
+from result_writer import STORE_SORT_COLUMNS
+
+PAGE_SIZE = 50
+FILE_ORDER = "File order"
+KEY = "results_viewer"
+JOB_KEY = "analysis_job"
+JOB_POLL_SECONDS = 1.0
+
+
+def current_job(key=None, name=None, work=None):
+    """This session's analysis job.
+
+    With a `key`, `work` is submitted unless the session's job is already for
+    that key, so reruns keep polling the same job. The job it replaces, for an
+    earlier upload, is cancelled unless another session is waiting on it too.
+    Without a key, the session's last job is returned, for example when coming
+    back to the page.
+    """
+    job = job_queue.get(st.session_state.get(JOB_KEY))
+    if key is not None and (job is None or job.key != key):
+        watcher = st.session_state.setdefault(f"{JOB_KEY}_watcher", uuid.uuid4().hex)
+        if job is not None:
+            job_queue.release(job, watcher)
+        job = job_queue.submit(key, name, work, watcher)
+        st.session_state[JOB_KEY] = job.id
+    return job
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job):
+    """Progress, per-stage timings and a cancel button, refreshed while the job runs.
+
+    Busy % is the share of the run each stage's workers were at work; the
+    busiest stage is the one holding the others back.
+    """
+    if not job.active:
+        # Rerun the whole page so it can show the outcome
+        st.rerun()
+    tracker = job.tracker
+    text = f"Waiting to start {job.name}…" if job.status == QUEUED else f"{job.name}: {tracker.summary()}"
+    st.progress(tracker.fraction(), text=text)
+    if tracker.stages:
+        st.dataframe(pd.DataFrame(
+            [(name, rows, round(seconds, 1), round(tracker.rows_per_second(name), 1),
+              round(100 * tracker.utilization(name)))
+             for name, (rows, seconds) in list(tracker.stages.items())],
+            columns=["Stage", "Rows", "Seconds", "Rows/s", "Busy %"],
+        ), hide_index=True)
+    if st.button("⏹️ Cancel", key=f"cancel_{job.id}"):
+        job.cancel()
+        st.info("Cancelling after the current chunks…")
+
+
+def job_status(job):
+    """Show where `job` stands; its result once it is done, otherwise None."""
+    if job.active:
+        job_progress(job)
+        return None
+    if job.status == FAILED:
+        st.error(f"Processing {job.name} failed: {job.error}")
+    elif job.status == CANCELLED:
+        st.warning(f"Processing {job.name} was cancelled.")
+    elif not all(os.path.exists(writer.path) for writer in job.result):
+        # run_cache deleted the files when newer runs pushed this one out
+        st.info(f"The results of {job.name} are no longer on disk; run the analysis again to get them.")
+    else:
+        return job.result
+    if st.button("🔁 Run again"):
+        del st.session_state[JOB_KEY]
+        st.rerun()
+    return None
+
+
+@st.fragment
+def results_viewer(store, page_size=PAGE_SIZE):
+    """Browse a finished ResultStore a page at a time.
+
+    Filtering, sorting and paging are done by SQLite, and only this fragment
+    reruns when they change, so the upload is not processed again and only the
+    rows on screen are sent to the browser.
+    """
+    if not os.path.exists(store.path):
+        st.info("These results are no longer on disk; run the analysis again to browse them.")
+        return
+    # A new results file starts with fresh filters and the first page
+    if st.session_state.get(f"{KEY}_path") != store.path:
+        for name in [name for name in st.session_state if str(name).startswith(f"{KEY}_")]:
+            del st.session_state[name]
+        st.session_state[f"{KEY}_path"] = store.path
+    departments = store.distinct("Department")
+    sentiments = store.distinct("Primary Sentiment")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        chosen_departments = st.multiselect("Department", departments, default=departments, key=f"{KEY}_departments")
+        keyword = st.text_input("Search comments", key=f"{KEY}_keyword")
+        sort = st.selectbox("Sort by", [FILE_ORDER, *STORE_SORT_COLUMNS], key=f"{KEY}_sort")
+    with col2:
+        chosen_sentiments = st.multiselect("Primary Sentiment", sentiments, default=sentiments, key=f"{KEY}_sentiments")
+        confidence = st.slider("Confidence", 0.0, 1.0, (0.0, 1.0), 0.01, key=f"{KEY}_confidence")
+        descending = st.toggle("Descending", key=f"{KEY}_descending")
+
+    # A filter that selects everything is left out so it does not constrain the query plan
+    filters = {
+        "departments": None if len(chosen_departments) == len(departments) else chosen_departments,
+        "sentiments": None if len(chosen_sentiments) == len(sentiments) else chosen_sentiments,
+        "confidence": None if confidence == (0.0, 1.0) else confidence,
+        "keyword": keyword,
+    }
+    total = store.count(**filters)
+    if not total:
+        st.info("No results match these filters.")
+        return
+    pages = math.ceil(total / page_size)
+    sort = None if sort == FILE_ORDER else sort
+    # Other filters or another order start again from the first page
+    view = (repr(filters), sort, descending)
+    if st.session_state.get(f"{KEY}_view") != view:
+        st.session_state[f"{KEY}_view"] = view
+        _go_to(1, None)
+    page = st.session_state[f"{KEY}_page"]
+    # Each page is read from the key of the row before it, so only its own rows are touched
+    frame = store.page(page_size, sort, descending, after=st.session_state[f"{KEY}_after"], **filters)
+
+    def previous():
+        # One row more than a page: the first of them is the key the previous page follows
+        rows = store.page(page_size + 1, sort, descending, before=store.key(frame, 0, sort), **filters)
+        _go_to(page - 1, store.key(rows, 0, sort) if len(rows) > page_size else None)
+
+    def last():
+        rows = store.page(total - (pages - 1) * page_size + 1, sort, descending, last=True, **filters)
+        _go_to(pages, store.key(rows, 0, sort) if pages > 1 else None)
+
+    first = (page - 1) * page_size
+    st.caption(f"Rows {first + 1:,}–{first + len(frame):,} of {total:,} (page {page:,} of {pages:,})")
+    st.dataframe(frame, hide_index=True)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.button("⏮️ First", key=f"{KEY}_first", disabled=page == 1, on_click=_go_to, args=(1, None))
+    col2.button("◀️ Previous", key=f"{KEY}_previous", disabled=page == 1, on_click=previous)
+    col3.button("Next ▶️", key=f"{KEY}_next", disabled=page >= pages, on_click=_go_to,
+                args=(page + 1, store.key(frame, -1, sort) if len(frame) else None))
+    col4.button("Last ⏭️", key=f"{KEY}_last", disabled=page >= pages, on_click=last)
+
+
+def _go_to(page, after):
+    st.session_state[f"{KEY}_page"] = page
+    st.session_state[f"{KEY}_after"] = after
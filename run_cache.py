@@ -0,0 +1,107 @@
+# run_cache.py
+
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from comment_pipeline import translation_failed
+
+MAX_RUNS = 8
+MAX_LINES = 10_000
+
+
+def _writers(run):
+    return run if isinstance(run, tuple) else (run,)
+
+
+def _delete(run):
+    for writer in _writers(run):
+        writer.delete()
+
+
+class RunCache:
+    """Finished analysis runs, shared by every rerun and session of the process.
+
+    A run is keyed by the content hash of its input and the fingerprint of the
+    pipeline that processed it (configuration and model version), so a rerun,
+    for example after a download click, reuses the finished result files
+    instead of processing the input again. Manual comments are memoized line by
+    line, so editing the text area only processes the lines that are new. Runs
+    and lines with failed translations are not stored, so they are retried.
+
+    The cache owns the files of the runs it holds: a run's files are deleted
+    when it is evicted, and not before, so a session offering them can rely on
+    them while the run is among the `max_runs` most recent.
+    """
+
+    def __init__(self, max_runs=MAX_RUNS, max_lines=MAX_LINES):
+        self.max_runs = max_runs
+        self.max_lines = max_lines
+        self._runs = OrderedDict()
+        self._unreused = itertools.count()
+        self._lines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The writers stored under `key`, or None if the run is unknown or its files were pruned."""
+        with self._lock:
+            run = self._runs.get(key)
+            if run is None:
+                return None
+            if not all(os.path.exists(writer.path) for writer in _writers(run)):
+                del self._runs[key]
+                _delete(run)
+                return None
+            self._runs.move_to_end(key)
+            return run
+
+    def put(self, key, run, reuse=True):
+        """Store a finished run: a closed result writer, or a tuple of them.
+
+        With `reuse` False, `get` never returns the run, but its files are kept
+        and deleted like those of any other run.
+        """
+        with self._lock:
+            if not reuse:
+                key = ("not reused", key, next(self._unreused))
+            evicted = [self._runs[key]] if self._runs.get(key, run) is not run else []
+            self._runs[key] = run
+            self._runs.move_to_end(key)
+            while len(self._runs) > self.max_runs:
+                evicted.append(self._runs.popitem(last=False)[1])
+        for old in evicted:
+            _delete(old)
+        return run
+
+    def process_lines(self, pipeline, lines) -> pd.DataFrame:
+        """`pipeline.process_chunk` over `lines`, processing only lines not seen before."""
+        found = {}
+        with self._lock:
+            for line in lines:
+                key = (pipeline.fingerprint, line)
+                if key in self._lines:
+                    self._lines.move_to_end(key)
+                    found[line] = self._lines[key]
+        missing = [line for line in dict.fromkeys(lines) if line not in found]
+        if missing:
+            processed = pipeline.process_chunk(pd.DataFrame({"Comments": missing}))
+            found.update(zip(missing, processed.to_dict("records")))
+            with self._lock:
+                for line in missing:
+                    if not translation_failed(found[line]["Translated"]):
+                        self._lines[(pipeline.fingerprint, line)] = found[line]
+                while len(self._lines) > self.max_lines:
+                    self._lines.popitem(last=False)
+        return pd.DataFrame([found[line] for line in lines])
+
+    def clear(self):
+        with self._lock:
+            self._runs.clear()
+            self._lines.clear()
+
+
+# Module state survives Streamlit reruns, so one instance serves the whole process
+run_cache = RunCache()
@@ -0,0 +1,84 @@
+# sentiment_service.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Concurrent sentiment requests (every session of the process, and every row of a
+# chunk) are queued and run through the model together. A batch closes once it
+# holds MAX_BATCH texts or its first text has waited MAX_WAIT_MS.
+MAX_BATCH = int(os.environ.get("PILGRIM_MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.environ.get("PILGRIM_MAX_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    """Run `predict` over batches of texts gathered from concurrent callers.
+
+    `predict` takes a list of texts and returns one result per text. A single
+    background thread owns the model, so callers never run forward passes side
+    by side. If a batch fails, its texts are retried one by one, so a bad input
+    only fails its own request.
+    """
+
+    def __init__(self, predict, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self._predict = predict
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts) -> list:
+        """Queue `texts`; return one Future per text."""
+        self._start()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return futures
+
+    def predict(self, texts) -> list:
+        """Results for `texts`, in order, once their batches have run."""
+        return [future.result() for future in self.submit(texts)]
+
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sentiment-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    # Texts already queued are taken even once the wait is over
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            results = self._predict([text for text, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            for item in batch:
+                self._run_batch([item])
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,151 @@
+# stage_pipeline.py
+
+import os
+import queue
+import threading
+
+# The chunks of a run move through the stages side by side: while one chunk
+# waits on the translation service, the chunk before it is being classified and
+# scored. The queues between stages are bounded, so a slow stage holds back the
+# stages before it instead of letting chunks pile up in memory.
+QUEUE_SIZE = int(os.environ.get("PILGRIM_STAGE_QUEUE", "2"))  # chunks waiting between two stages
+
+_POLL_SECONDS = 0.1  # how often blocked threads check whether the run was stopped
+_END = object()
+_STOPPED = object()
+
+
+class Stage:
+    """A named step of a run: `work(chunk)` returns the chunk for the next stage.
+
+    `workers` threads run the stage, so it can work on that many chunks at once.
+    """
+
+    def __init__(self, name, work, workers=1):
+        self.name = name
+        self.work = work
+        self.workers = max(1, workers)
+
+
+class Passed:
+    """A finished chunk, such as one loaded from a checkpoint: it skips every
+    stage but keeps its place in the output."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def run_stages(chunks, stages, progress=None, queue_size=QUEUE_SIZE):
+    """Yield `chunks` run through `stages` one after another, in input order.
+
+    `chunks` is read on a thread of its own, so reading the input overlaps
+    with the stages too. Every stage is timed on `progress`, a
+    `progress.ProgressTracker`, together with its number of workers, so the
+    tracker can tell how busy each stage was. An exception raised while reading
+    or in a stage stops the run and is raised here; closing the generator early
+    stops the run after the chunks being worked on.
+    """
+    stop = threading.Event()
+    errors = []
+    # A chunk holds a slot until it is yielded, so chunks waiting behind a slow
+    # one to be put back in order are bounded too, not only the queues
+    slots = threading.BoundedSemaphore(queue_size * len(stages) + sum(stage.workers for stage in stages) + 1)
+    queues = [queue.Queue(queue_size) for _ in stages] + [queue.Queue()]
+    remaining = [stage.workers for stage in stages]
+    lock = threading.Lock()
+    if progress is not None:
+        progress.workers.update((stage.name, stage.workers) for stage in stages)
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return _STOPPED
+
+    def read():
+        try:
+            for index, chunk in enumerate(chunks):
+                while not slots.acquire(timeout=_POLL_SECONDS):
+                    if stop.is_set():
+                        return
+                if not put(queues[0], (index, chunk)):
+                    return
+            put(queues[0], _END)
+        except BaseException as e:
+            fail(e)
+
+    def work(position, stage):
+        inbox, outbox = queues[position], queues[position + 1]
+        while True:
+            item = get(inbox)
+            if item is _STOPPED:
+                return
+            if item is _END:
+                # Pass the end on to this stage's other workers; the last one out tells the next stage
+                put(inbox, _END)
+                with lock:
+                    remaining[position] -= 1
+                    last = remaining[position] == 0
+                if last:
+                    put(outbox, _END)
+                return
+            index, chunk = item
+            if not isinstance(chunk, Passed):
+                try:
+                    if progress is not None:
+                        with progress.stage(stage.name, len(chunk)):
+                            chunk = stage.work(chunk)
+                    else:
+                        chunk = stage.work(chunk)
+                except BaseException as e:
+                    fail(e)
+                    return
+            if not put(outbox, (index, chunk)):
+                return
+
+    threads = [threading.Thread(target=read, name="stage-read", daemon=True)]
+    for position, stage in enumerate(stages):
+        threads.extend(
+            threading.Thread(target=work, args=(position, stage), name=f"stage-{stage.name.lower()}-{i}", daemon=True)
+            for i in range(stage.workers)
+        )
+    for thread in threads:
+        thread.start()
+
+    waiting = {}
+    next_index = 0
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _STOPPED:
+                raise errors[0]
+            if item is _END:
+                return
+            index, chunk = item
+            waiting[index] = chunk
+            while next_index in waiting:
+                chunk = waiting.pop(next_index)
+                next_index += 1
+                slots.release()
+                yield chunk.value if isinstance(chunk, Passed) else chunk
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
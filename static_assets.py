@@ -0,0 +1,94 @@
+# static_assets.py
+
+import base64
+import hashlib
+import io
+import os
+import threading
+
+import streamlit as st
+
+# Background images are recompressed once per process and served as static files
+# (Streamlit's `server.enableStaticServing`), so reruns only resend a short URL.
+# PILGRIM_ASSET_FORMAT=original keeps the source bytes; avif needs Pillow's AVIF codec.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSET_FORMAT = os.environ.get("PILGRIM_ASSET_FORMAT", "webp").lower()
+ASSET_MAX_WIDTH = int(os.environ.get("PILGRIM_ASSET_MAX_WIDTH", "1920"))
+ASSET_QUALITY = int(os.environ.get("PILGRIM_ASSET_QUALITY", "80"))
+
+_MIME_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+
+_urls = {}
+_lock = threading.Lock()
+
+
+def _recompress(payload, fmt, max_width, quality):
+    """Downscale to `max_width` and re-encode as `fmt`; None if Pillow cannot."""
+    try:
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(payload))
+        if max_width and image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt.upper(), quality=quality)
+    except Exception:
+        # Pillow, or the codec for `fmt`, is unavailable: serve the original
+        return None
+    return buffer.getvalue()
+
+
+def _encode(image_file, fmt, max_width, quality):
+    with open(image_file, "rb") as f:
+        payload = f.read()
+    ext = os.path.splitext(image_file)[1].lstrip(".").lower()
+    if fmt != "original":
+        recompressed = _recompress(payload, fmt, max_width, quality)
+        # Keep the source if re-encoding did not make it smaller
+        if recompressed is not None and len(recompressed) < len(payload):
+            payload, ext = recompressed, fmt
+    return payload, ext
+
+
+def _publish(image_file, payload, ext):
+    """Write `payload` under a content-hashed name in STATIC_DIR; return its URL."""
+    stem = os.path.splitext(os.path.basename(image_file))[0]
+    name = f"{stem}.{hashlib.blake2b(payload, digest_size=8).hexdigest()}.{ext}"
+    path = os.path.join(STATIC_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    return f"app/static/{name}"
+
+
+def asset_url(image_file, fmt=ASSET_FORMAT, max_width=ASSET_MAX_WIDTH, quality=ASSET_QUALITY) -> str:
+    """URL for an image to use in CSS, encoded once per process.
+
+    With static serving enabled the image is published as a static file;
+    otherwise it falls back to a data URI, still encoded only once.
+    """
+    key = (image_file, fmt, max_width, quality)
+    with _lock:
+        if key in _urls:
+            return _urls[key]
+
+    payload, ext = _encode(image_file, fmt, max_width, quality)
+    url = None
+    if st.get_option("server.enableStaticServing"):
+        try:
+            url = _publish(image_file, payload, ext)
+        except OSError:
+            # Read-only deployment: inline the image instead
+            url = None
+    if url is None:
+        mime = _MIME_TYPES.get(ext, f"image/{ext}")
+        url = f"data:{mime};base64,{base64.b64encode(payload).decode()}"
+
+    with _lock:
+        _urls[key] = url
+    return url
@@ -0,0 +1,53 @@
+import random
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+THEMES = {"Transport": ["bus", "driver"], "Food Quality & Dining": ["food", "meal"]}
+
+
+class SimulatedModel:
+    """Stands in for the transformers sentiment pipeline: "good" is POSITIVE, one call at a time."""
+
+    def __init__(self):
+        self.model = types.SimpleNamespace(config=types.SimpleNamespace(_commit_hash="test"))
+        self._device = threading.Lock()
+
+    def __call__(self, texts, **kwargs):
+        with self._device:
+            return [{"label": "POSITIVE" if "good" in text else "NEGATIVE", "score": 0.9} for text in texts]
+
+
+class Translator:
+    """Stands in for GoogleTranslator; takes a little random time, so chunks finish out of order."""
+
+    unreachable = False
+
+    def __init__(self, source="auto", target="en"):
+        pass
+
+    def translate(self, text):
+        time.sleep(random.random() / 2000)
+        if Translator.unreachable:
+            raise ConnectionError("translation service unreachable")
+        return f"en: {text}"
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    """A CommentPipeline on a simulated model and translator; result files and checkpoints go to tmp_path."""
+    transformers = types.ModuleType("transformers")
+    transformers.pipeline = lambda *args, **kwargs: SimulatedModel()
+    deep_translator = types.ModuleType("deep_translator")
+    deep_translator.GoogleTranslator = Translator
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    monkeypatch.setitem(sys.modules, "deep_translator", deep_translator)
+    monkeypatch.setattr(Translator, "unreachable", False)
+    monkeypatch.chdir(tmp_path)
+
+    from comment_pipeline import CommentPipeline
+
+    return CommentPipeline(THEMES)
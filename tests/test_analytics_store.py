@@ -0,0 +1,102 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from analytics_store import AnalyticsStore
+from data_loader import AGE_COL, GENDER_COL, NATIONALITY_COL
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ["sqlite", pytest.param("duckdb", marks=pytest.mark.skipif(
+    importlib.util.find_spec("duckdb") is None, reason="duckdb is not installed"))]
+
+
+def processed(rows, offset=0):
+    """A processed chunk as the pipeline yields it, with some missing values."""
+    i = pd.RangeIndex(offset, offset + rows)
+    return pd.DataFrame({
+        "Original": [f"comment {n}" for n in i],
+        "Translated": [f"comment {n}" for n in i],
+        "Department": [["Transport", "Food", None][n % 3] for n in i],
+        "Primary Sentiment": [["POSITIVE", "NEGATIVE"][n % 2] for n in i],
+        "Confidence": [0.5 + (n % 5) / 10 for n in i],
+        NATIONALITY_COL: [["Egypt", "Pakistan", None, "Egypt"][n % 4] for n in i],
+        GENDER_COL: ["ذكر"] * rows,
+        AGE_COL: [20 + n % 50 for n in i],
+    })
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_breakdown_totals_match_the_rows_recorded(tmp_path, backend):
+    store = AnalyticsStore(str(tmp_path / f"analytics.{backend}"))
+    chunks = [processed(70), processed(45, offset=70)]
+    with store.recorder("run", "upload.csv") as recorder:
+        for chunk in chunks:
+            recorder.write(chunk)
+    rows = pd.concat(chunks)
+
+    by_department = store.breakdown(["department"])
+    assert by_department["comments"].sum() == len(rows)
+    expected = rows["Department"].fillna("(none)").value_counts()
+    got = by_department.assign(department=by_department["department"].fillna("(none)"))
+    assert got.set_index("department")["comments"].to_dict() == expected.to_dict()
+
+    # Raw rows (age is not in the rollup) agree with the rollup
+    assert store.breakdown(["age"])["comments"].sum() == len(rows)
+    egypt = store.breakdown(["sentiment"], nationalities=["Egypt"])
+    assert egypt["comments"].sum() == (rows[NATIONALITY_COL] == "Egypt").sum()
+    mean = store.breakdown([])["mean_confidence"].iloc[0]
+    assert mean == pytest.approx(rows["Confidence"].mean())
+
+    # Recording the run again replaces it
+    with store.recorder("run", "upload.csv") as recorder:
+        recorder.write(chunks[0])
+    assert store.breakdown([])["comments"].iloc[0] == len(chunks[0])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_failed_run_is_not_recorded(tmp_path, backend):
+    store = AnalyticsStore(str(tmp_path / f"analytics.{backend}"))
+    with pytest.raises(RuntimeError):
+        with store.recorder("run", "upload.csv") as recorder:
+            recorder.write(processed(10))
+            raise RuntimeError("stopped")
+    assert store.breakdown([]).empty
+    assert store.runs().empty
+
+
+WRITER = """
+import sys, time
+sys.path.insert(0, {root!r}); sys.path.insert(0, {tests!r})
+import analytics_store
+from analytics_store import AnalyticsStore
+from test_analytics_store import processed
+# Far shorter than a run: a writer holding the store for its whole run fails the other
+analytics_store.LOCK_TIMEOUT = 1
+with AnalyticsStore({path!r}).recorder({key!r}, {key!r}) as recorder:
+    for n in range(8):
+        recorder.write(processed(25, offset=25 * n))
+        time.sleep(0.25)
+"""
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_two_processes_record_into_one_store(tmp_path, backend):
+    path = str(tmp_path / f"analytics.{backend}")
+    AnalyticsStore(path).runs()  # create the tables before both writers start
+    writers = [
+        subprocess.Popen([sys.executable, "-c", WRITER.format(
+            root=ROOT, tests=os.path.dirname(os.path.abspath(__file__)), path=path, key=key)],
+            stderr=subprocess.PIPE, text=True)
+        for key in ("nightly batch", "upload")
+    ]
+    for writer in writers:
+        _, errors = writer.communicate(timeout=120)
+        assert writer.returncode == 0, errors
+
+    store = AnalyticsStore(path)
+    assert sorted(store.runs()["source_file"]) == ["nightly batch", "upload"]
+    assert store.breakdown([])["comments"].iloc[0] == 2 * 8 * 25
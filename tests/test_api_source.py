@@ -0,0 +1,131 @@
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import api_source
+from api_source import ApiFeed, api_feed, make_session
+from data_loader import AGE_COL, GENDER_COL, NATIONALITY_COL
+
+HEADER = f"{AGE_COL},{NATIONALITY_COL},{GENDER_COL}\n"
+
+
+def csv_rows(*ages):
+    return (HEADER + "".join(f"{age},Egypt,ذكر\n" for age in ages)).encode("utf-8")
+
+
+def json_rows(*ages):
+    return [{AGE_COL: age, NATIONALITY_COL: "Egypt", GENDER_COL: "ذكر"} for age in ages]
+
+
+class StandIn:
+    """Routes of the stand-in server: path -> (status, headers, body). Requests are logged."""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+
+@pytest.fixture
+def server():
+    stand_in = StandIn()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            stand_in.requests.append((self.path, dict(self.headers)))
+            parts = urlsplit(self.path)
+            route = stand_in.routes.get(parts.path)
+            if callable(route):
+                route = route(self.headers, parse_qs(parts.query))
+            status, headers, body = route or (404, {}, b"")
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    stand_in.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield stand_in
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def feed(server, path):
+    return ApiFeed(server.base + path, session=make_session(retries=0))
+
+
+def test_etag_revalidation_gets_304(server):
+    def route(headers, query):
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return 200, {"ETag": '"v1"', "Content-Type": "text/csv"}, csv_rows(20, 30)
+
+    server.routes["/data.csv"] = route
+    api = feed(server, "/data.csv")
+    assert list(api.fetch()[AGE_COL]) == [20, 30]
+    digest = api.digest
+    api.fetch()
+    assert server.requests[-1][1].get("If-None-Match") == '"v1"'
+    assert api.digest == digest
+    assert api.version == 1
+
+
+def test_unchanged_body_without_validators_keeps_digest(server):
+    server.routes["/data.csv"] = (200, {"Content-Type": "text/csv"}, csv_rows(20, 30))
+    api = feed(server, "/data.csv")
+    api.fetch()
+    digest = api.digest
+    for _ in range(2):
+        api.fetch()
+        assert api.digest == digest
+    assert api.version == 1
+
+    server.routes["/data.csv"] = (200, {"Content-Type": "text/csv"}, csv_rows(20, 30, 40))
+    assert list(api.fetch()[AGE_COL]) == [20, 30, 40]
+    assert api.digest != digest
+    assert api.version == 2
+
+
+def test_link_header_paging(server):
+    server.routes["/p1.csv"] = (200, {"Content-Type": "text/csv", "Link": '</p2.csv>; rel="next"'}, csv_rows(20))
+    server.routes["/p2.csv"] = (200, {"Content-Type": "text/csv", "ETag": '"p2"'}, csv_rows(30))
+    api = feed(server, "/p1.csv")
+    assert list(api.fetch()[AGE_COL]) == [20, 30]
+
+    # A refresh starts again from the last known page
+    server.requests.clear()
+    api.fetch()
+    assert [path for path, _ in server.requests] == ["/p2.csv"]
+
+
+def test_json_next_cursor_paging(server):
+    def route(headers, query):
+        if query.get("cursor") == ["2"]:
+            return 200, {"Content-Type": "application/json"}, json.dumps({"data": json_rows(30)}).encode()
+        return 200, {"Content-Type": "application/json"}, json.dumps(
+            {"data": json_rows(20), "next_cursor": "2"}).encode()
+
+    server.routes["/items"] = route
+    api = feed(server, "/items")
+    assert list(api.fetch()[AGE_COL]) == [20, 30]
+    assert [path for path, _ in server.requests] == ["/items", "/items?cursor=2"]
+
+
+def test_least_recently_used_feeds_are_dropped(monkeypatch):
+    monkeypatch.setattr(api_source, "MAX_FEEDS", 2)
+    monkeypatch.setattr(api_source, "_feeds", OrderedDict())
+    first, second = api_feed("http://a/"), api_feed("http://b/")
+    assert api_feed("http://a/") is first
+    api_feed("http://c/")
+    assert api_feed("http://a/") is first
+    assert api_feed("http://b/") is not second
@@ -0,0 +1,103 @@
+import io
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import jobs
+from analytics_store import AnalyticsStore
+from checkpoints import Checkpoint
+from comment_pipeline import extract_comments_in_chunks
+from jobs import CANCELLED, DONE, FAILED, JobQueue, analyze_upload
+from run_cache import RunCache
+
+
+class Upload(io.BytesIO):
+    """What st.file_uploader returns, as far as analyze_upload is concerned."""
+
+    def __init__(self, data, name="comments.csv"):
+        super().__init__(data)
+        self.name = name
+
+
+def comments(rows):
+    return Upload(("Comments\n" + "".join(f"{'good' if n % 3 else 'bad'} bus {n}\n" for n in range(rows))).encode())
+
+
+def finished(job, timeout=60):
+    deadline = time.monotonic() + timeout
+    while job.active:
+        assert time.monotonic() < deadline, f"{job.name} still {job.status}"
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    """A job queue whose runs are cached and recorded apart from other tests'."""
+    monkeypatch.setattr(jobs, "run_cache", RunCache())
+    monkeypatch.setattr(jobs, "analytics_store", AnalyticsStore(str(tmp_path / "analytics.sqlite")))
+    return JobQueue(workers=1)
+
+
+def test_job_survives_an_unusable_analytics_store(pipeline, queue, monkeypatch):
+    def locked():
+        raise OSError("Could not set lock on file")
+
+    monkeypatch.setattr(jobs.analytics_store, "_connect", locked)
+    job = finished(queue.submit("upload", "comments.csv", analyze_upload(pipeline, comments(1200), chunksize=100)))
+    assert job.status == DONE, job.error
+    writer, _, _ = job.result
+    assert len(pd.read_csv(writer.path)) == 1200
+
+
+def test_cancelled_job_stops(pipeline, queue, monkeypatch):
+    translating, cancelled = threading.Event(), threading.Event()
+    translate = pipeline.translate_chunk
+    translated = []
+
+    def waiting_translate(chunk):
+        translating.set()
+        cancelled.wait(10)
+        translated.append(len(chunk))
+        return translate(chunk)
+
+    monkeypatch.setattr(pipeline, "translate_chunk", waiting_translate)
+    job = queue.submit("upload", "comments.csv", analyze_upload(pipeline, comments(5000), chunksize=100))
+    assert translating.wait(10)
+    job.cancel()
+    cancelled.set()
+    assert finished(job).status == CANCELLED
+    assert len(translated) < 50
+    assert job.result is None
+
+
+def test_reading_error_fails_the_job(pipeline, queue):
+    job = finished(queue.submit("upload", "scan.png", analyze_upload(pipeline, Upload(b"\x89PNG", name="scan.png"))))
+    assert job.status == FAILED
+    assert job.error == "Unsupported file format."
+
+
+def test_job_resumes_from_a_partial_checkpoint(pipeline, queue, monkeypatch):
+    upload, chunksize = comments(1000), 100
+    chunks = list(extract_comments_in_chunks(Upload(upload.getvalue()), chunksize))
+    # An earlier attempt finished chunks 0, 3 and 4 before it stopped
+    checkpoint = Checkpoint(("upload", chunksize))
+    for index in (0, 3, 4):
+        processed = pipeline.process_chunk(chunks[index].copy())
+        processed["Department"] = "from checkpoint"
+        checkpoint.save(index, index * chunksize, processed)
+
+    translate = pipeline.translate_chunk
+    translated = []
+    monkeypatch.setattr(pipeline, "translate_chunk", lambda chunk: translated.append(len(chunk)) or translate(chunk))
+    job = finished(queue.submit("upload", "comments.csv", analyze_upload(pipeline, upload, chunksize=chunksize)))
+    assert job.status == DONE, job.error
+    assert translated == [chunksize] * (len(chunks) - 3)
+
+    written = pd.read_csv(job.result[0].path)
+    assert written["Original"].tolist() == pd.concat(chunks)["Comments"].tolist()
+    from_checkpoint = written["Department"].eq("from checkpoint")
+    assert from_checkpoint.tolist() == [n // chunksize in (0, 3, 4) for n in range(1000)]
+    assert Checkpoint(("upload", chunksize)).completed == 0
@@ -0,0 +1,98 @@
+import io
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+from comment_pipeline import extract_comments_in_chunks
+from data_loader import AGE_COL, GENDER_COL, NATIONALITY_COL
+from result_writer import STORE_COLUMNS, ResultStore, ResultWriter
+
+
+def upload(text, name="comments.csv"):
+    file = io.BytesIO(text.encode("utf-8"))
+    file.name = name
+    return file
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_demographic_dtypes_can_change_between_chunks(tmp_path, fmt):
+    pytest.importorskip("pyarrow")
+    # The first chunk infers integer ages and numeric nationalities; later chunks do not
+    rows = [f"c{i},{30 + i},{i},ذكر" for i in range(3)] + ["5,n/a,Egypt,", "c4,4.5,,أنثى", ",,Egypt,ذكر"]
+    text = f"Comments,{AGE_COL},{NATIONALITY_COL},{GENDER_COL}\n" + "\n".join(rows) + "\n"
+    path = tmp_path / f"results.{fmt}"
+    with ResultWriter(fmt, path=str(path), preview_rows=0) as writer:
+        for chunk in extract_comments_in_chunks(upload(text), chunksize=3):
+            writer.write(chunk)
+
+    if fmt == "parquet":
+        written = pd.read_parquet(path)
+    else:
+        import pyarrow as pa
+
+        written = pa.ipc.open_file(str(path)).read_all().to_pandas()
+    assert written["Comments"].tolist()[:5] == ["c0", "c1", "c2", "5", "c4"]
+    assert written[AGE_COL].fillna(-1).tolist()[:5] == [30, 31, 32, -1, 4.5]
+    assert written[NATIONALITY_COL].tolist()[:4] == ["0", "1", "2", "Egypt"]
+
+
+def test_incompatible_chunk_is_coerced_to_the_file_schema(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "results.parquet"
+    with ResultWriter("parquet", path=str(path), preview_rows=0) as writer:
+        writer.write(pd.DataFrame({"Comments": ["a", "b"], AGE_COL: [20, 30]}))
+        writer.write(pd.DataFrame({"Comments": [1, 2], AGE_COL: ["n/a", 4.5]}))
+    written = pd.read_parquet(path)
+    assert written["Comments"].tolist()[:3] == ["a", "b", "1"]
+    assert written[AGE_COL].tolist()[:2] == [20, 30]
+    assert written[AGE_COL].isna().tolist()[2:] == [True, True]
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A finished store of 103 rows with few distinct, and some missing, sort values."""
+    rows = pd.DataFrame({
+        "Original": [f"comment {n}" for n in range(103)],
+        "Translated": [f"comment {n}" for n in range(103)],
+        "Department": [["Transport", "Food", None, "Housing"][n % 4] for n in range(103)],
+        "Primary Sentiment": [["POSITIVE", "NEGATIVE"][n % 2] for n in range(103)],
+        "Confidence": [[0.9, None, 0.5, 0.9, 0.7][n % 5] for n in range(103)],
+    })
+    with ResultStore(directory=str(tmp_path)) as store:
+        for start in range(0, 103, 40):
+            store.write(rows[start:start + 40])
+    return store
+
+
+@pytest.mark.parametrize("sort", [None, "Department", "Confidence"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_follow_the_full_ordering(store, sort, descending):
+    size = 10
+    direction = "DESC" if descending else "ASC"
+    order = f"{STORE_COLUMNS[sort]} {direction}, id {direction}" if sort else f"id {direction}"
+    with closing(sqlite3.connect(store.path)) as db:
+        expected = [row_id for row_id, in db.execute("SELECT id FROM results WHERE sentiment = 'POSITIVE'"
+                                                       f" ORDER BY {order}")]
+    filters = {"sentiments": ["POSITIVE"]}
+    assert store.count(**filters) == len(expected) == 52
+
+    def page(**position):
+        return store.page(size, sort, descending, **position, **filters)
+
+    # First, then Next to the end
+    pages = [page()]
+    while len(pages[-1]) == size:
+        pages.append(page(after=store.key(pages[-1], -1, sort)))
+    assert [list(p.index) for p in pages] == [expected[i:i + size] for i in range(0, len(expected), size)]
+
+    # Last, then Previous to the start: the pages end where the last one does
+    last = page(last=True)
+    assert list(last.index) == expected[-size:]
+    backwards = [last]
+    while len(backwards[-1]) == size:
+        backwards.append(page(before=store.key(backwards[-1], 0, sort)))
+    ids = [row_id for p in reversed(backwards) for row_id in p.index]
+    assert ids == expected
+    assert len(backwards[-1]) == (len(expected) % size or size)
@@ -0,0 +1,36 @@
+import os
+
+import pandas as pd
+
+from result_writer import ResultWriter
+from run_cache import RunCache
+
+
+def finished_run(directory):
+    with ResultWriter("csv", directory=str(directory)) as writer:
+        writer.write(pd.DataFrame({"Comments": ["a"]}))
+    return writer
+
+
+def test_files_live_until_their_run_is_evicted(tmp_path):
+    cache = RunCache(max_runs=2)
+    runs = [cache.put(key, finished_run(tmp_path)) for key in "abc"]
+    assert not os.path.exists(runs[0].path)
+    assert all(os.path.exists(run.path) for run in runs[1:])
+    assert cache.get("a") is None
+    assert cache.get("c") is runs[2]
+
+    # Many more writers than the cache holds: nothing it holds is deleted
+    others = [finished_run(tmp_path) for _ in range(40)]
+    assert cache.get("b") is runs[1] and cache.get("c") is runs[2]
+    assert all(os.path.exists(run.path) for run in others)
+
+
+def test_unreused_run_is_not_returned_but_its_files_are_kept(tmp_path):
+    cache = RunCache(max_runs=2)
+    partial = cache.put("a", finished_run(tmp_path), reuse=False)
+    assert cache.get("a") is None
+    assert os.path.exists(partial.path)
+    cache.put("b", finished_run(tmp_path))
+    cache.put("c", finished_run(tmp_path))
+    assert not os.path.exists(partial.path)
@@ -0,0 +1,71 @@
+import io
+import random
+import time
+
+import pandas as pd
+import pytest
+
+from comment_pipeline import extract_comments_in_chunks
+from stage_pipeline import Passed, Stage, run_stages
+
+
+def upload(rows):
+    file = io.BytesIO(("Comments\n" + "".join(f"comment {n} about the bus\n" for n in range(rows))).encode())
+    file.name = "comments.csv"
+    return file
+
+
+def test_chunks_come_out_in_input_order(pipeline):
+    chunks = list(extract_comments_in_chunks(upload(600), chunksize=25))
+    stages = pipeline.stages(translation_workers=6)
+    processed = list(run_stages(chunks, stages, queue_size=1))
+    assert [len(chunk) for chunk in processed] == [25] * 24
+    originals = pd.concat(processed)["Original"].tolist()
+    assert originals == [f"comment {n} about the bus" for n in range(600)]
+    assert pd.concat(processed)["Department"].eq("Transport").all()
+
+
+def test_passed_chunks_keep_their_place():
+    def slow(n):
+        time.sleep(random.random() / 100)
+        return n * 10
+
+    chunks = [Passed(n) if n % 3 == 0 else n for n in range(30)]
+    assert list(run_stages(chunks, [Stage("Slow", slow, workers=4)])) == [
+        n if n % 3 == 0 else n * 10 for n in range(30)
+    ]
+
+
+def test_error_while_reading_stops_the_run():
+    def chunks():
+        yield from range(5)
+        raise ValueError("Unsupported file format.")
+
+    worked = []
+
+    def work(n):
+        worked.append(n)
+        return n
+
+    with pytest.raises(ValueError, match="Unsupported"):
+        list(run_stages(chunks(), [Stage("Work", work, workers=2)]))
+    assert len(worked) <= 5
+
+
+def test_error_in_a_stage_stops_the_run():
+    def fail_on_seven(n):
+        if n == 7:
+            raise RuntimeError("model crashed")
+        return n
+
+    read = []
+
+    def chunks():
+        for n in range(10_000):
+            read.append(n)
+            yield n
+
+    with pytest.raises(RuntimeError, match="model crashed"):
+        list(run_stages(chunks(), [Stage("Work", fail_on_seven, workers=3)], queue_size=1))
+    # The bounded queues stopped the reader long before the end of the input
+    assert len(read) < 100